@@ -0,0 +1,201 @@
+"""
+Global assignment of hits to tracks within one detector layer. Every track
+predicts a position with a variance; a hit is a candidate for a track only
+if it lies inside the gate of the track, i.e. if its :math:`\\chi^2`
+distance
+
+.. math::
+    \\chi^2 = \\frac{(y - \\hat{y})^2}{\\sigma^2}
+
+does not exceed *gate*. Leaving a track without a hit costs *gate*. Among
+all assignments in which every hit is used at most once, the one with the
+smallest total cost is chosen, so the result does not depend on the order of
+the tracks.
+
+The gated costs form a sparse bipartite graph. It is split into connected
+components, and each component is solved exactly with the Hungarian
+algorithm. In typical events the components are small, so the cost grows
+almost linearly with the number of tracks::
+
+    >>> # greedily, the first track would take the first hit
+    >>> assign([0.15, 0.1], [0.01, 0.01], [0.14, 0.2], [1, 1])
+    [1, 0]
+"""
+# pylint: disable=C0103,R0914
+from hitindex import HitIndex
+
+# cost of forbidden pairs, large but finite so that sums stay well defined
+_FORBIDDEN = 1e30
+
+
+def hungarian(cost):
+    """Solve a square assignment problem with the Hungarian algorithm
+    (shortest augmenting paths with potentials, :math:`O(n^3)`).
+
+    :param cost: square matrix of costs as nested lists
+    :return: the column assigned to every row
+    :rtype: list(int)
+    """
+    n = len(cost)
+    # 1-based potentials and matching, column 0 is the virtual start
+    u = [0.0] * (n + 1)
+    v = [0.0] * (n + 1)
+    match = [0] * (n + 1)
+    way = [0] * (n + 1)
+    for row in xrange(1, n + 1):
+        match[0] = row
+        column = 0
+        shortest = [float('inf')] * (n + 1)
+        used = [False] * (n + 1)
+        while True:
+            used[column] = True
+            current = match[column]
+            costs = cost[current - 1]
+            delta = float('inf')
+            nearest = 0
+            for j in xrange(1, n + 1):
+                if used[j]:
+                    continue
+                reduced = costs[j - 1] - u[current] - v[j]
+                if reduced < shortest[j]:
+                    shortest[j] = reduced
+                    way[j] = column
+                if shortest[j] < delta:
+                    delta = shortest[j]
+                    nearest = j
+            for j in xrange(n + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    shortest[j] -= delta
+            column = nearest
+            if match[column] == 0:
+                break
+        # flip the augmenting path
+        while column:
+            previous = way[column]
+            match[column] = match[previous]
+            column = previous
+    result = [0] * n
+    for column in xrange(1, n + 1):
+        result[match[column] - 1] = column - 1
+    return result
+
+
+def gated_costs(predictions, variances, positions, gate=9.0):
+    """Return the :math:`\\chi^2` distances of all track-candidate pairs
+    inside the gate. The gates of all tracks are matched against the sorted
+    candidate positions in one pass (:py:meth:`hitindex.HitIndex.match`), so
+    only pairs inside the gate are visited.
+
+    :param predictions: predicted position of every track
+    :param variances: variance of every prediction
+    :param positions: position of every candidate
+    :param float gate: largest allowed :math:`\\chi^2` distance
+    :return: ``(track, candidate, cost)`` triples
+    :rtype: list(tuple)
+    """
+    reaches = [(gate * variance) ** 0.5 if variance > 0 else 0.0
+               for variance in variances]
+    windows = HitIndex(positions).match(
+        [predicted - reach for predicted, reach in zip(predictions, reaches)],
+        [predicted + reach for predicted, reach in zip(predictions, reaches)])
+    pairs = []
+    for track, (predicted, variance, window) in enumerate(zip(
+            predictions, variances, windows)):
+        for candidate in window:
+            distance = (positions[candidate] - predicted) ** 2
+            cost = distance / variance if variance > 0 else 0.0
+            if cost <= gate:
+                pairs.append((track, candidate, cost))
+    return pairs
+
+
+def _components(pairs):
+    """ Group the tracks and candidates of gated pairs into connected
+    components, returned as lists of pairs. """
+    parent = {}
+
+    def find(node):
+        """ Return the representative of a node, compressing the path. """
+        root = node
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while node != root:
+            node, parent[node] = parent.get(node, node), root
+        return root
+
+    for track, candidate, _ in pairs:
+        first, second = find(('t', track)), find(('c', candidate))
+        if first != second:
+            parent[first] = second
+    groups = {}
+    for pair in pairs:
+        groups.setdefault(find(('t', pair[0])), []).append(pair)
+    return groups.values()
+
+
+def _solve(pairs, counts, gate):
+    """ Solve one connected component exactly. Candidates hit several times
+    are split into one slot per hit. """
+    tracks = sorted(set(track for track, _, _ in pairs))
+    candidates = sorted(set(candidate for _, candidate, _ in pairs))
+    # no candidate can take more tracks than the component has
+    slots = [candidate for candidate in candidates
+             for _ in xrange(min(counts[candidate], len(tracks)))]
+    rows, columns = len(tracks), len(slots)
+    row_of = dict((track, i) for i, track in enumerate(tracks))
+    columns_of = {}
+    for j, candidate in enumerate(slots):
+        columns_of.setdefault(candidate, []).append(j)
+    # tracks x slots | tracks x misses
+    # slots x slots  | slots x tracks
+    n = rows + columns
+    cost = [[_FORBIDDEN] * n for _ in xrange(n)]
+    for track, candidate, value in pairs:
+        row = cost[row_of[track]]
+        for j in columns_of[candidate]:
+            row[j] = value
+    for i in xrange(rows):
+        cost[i][columns + i] = gate
+    for j in xrange(columns):
+        row = cost[rows + j]
+        row[j] = 0.0
+        for i in xrange(rows):
+            row[columns + i] = 0.0
+    solution = hungarian(cost)
+    result = {}
+    for i, track in enumerate(tracks):
+        j = solution[i]
+        if j < columns and cost[i][j] < _FORBIDDEN:
+            result[track] = slots[j]
+    return result
+
+
+def assign(predictions, variances, positions, counts, gate=9.0):
+    """Assign candidates to tracks with the smallest total cost.
+
+    :param predictions: predicted position of every track
+    :param variances: variance of every prediction
+    :param positions: position of every candidate
+    :param counts: number of tracks every candidate can be assigned to
+    :param float gate: largest allowed :math:`\\chi^2` distance, also the cost
+     of a track without a candidate
+    :return: the candidate of every track, ``None`` for unassigned tracks
+    :rtype: list(int)
+    """
+    result = [None] * len(predictions)
+    pairs = [pair for pair in gated_costs(predictions, variances, positions,
+                                          gate) if counts[pair[1]] > 0]
+    for component in _components(pairs):
+        tracks = set(track for track, _, _ in component)
+        candidates = set(candidate for _, candidate, _ in component)
+        if len(tracks) == 1 and len(candidates) == 1:
+            # the common case of an isolated track and hit
+            track, candidate, _ = component[0]
+            result[track] = candidate
+            continue
+        for track, candidate in _solve(component, counts, gate).items():
+            result[track] = candidate
+    return result
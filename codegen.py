@@ -0,0 +1,259 @@
+"""
+Code generation of shape specialized Kalman filter steps. For a model with
+fixed matrices **A**, **H**, **Q** and **R** the update and prediction of
+:py:class:`kfilter.LKFilter` can be written out as straight-line Python code
+working on flat tuples of floats. The entries of the model matrices are
+inserted into the code as constants, so multiplications by structural zeros
+are dropped and multiplications by one are skipped::
+
+    >>> model = compile_model(A, H, Q, R)
+    >>> print model.source
+    def update(x, P, z):
+    ...
+    >>> x, P = model.update(x, P, z)
+    >>> x, P = model.predict(x, P)
+
+Here ``x`` is the state vector as a tuple, ``P`` the row-major flattened
+covariance and ``z`` the measurement vector. The most recently used compiled
+models are cached, so compiling the same model twice returns the same object.
+The generated code is used by :py:class:`kfilter.CompiledLKFilter`.
+"""
+# pylint: disable=C0103,W0122
+import collections
+import math
+from matrix import Matrix
+
+CompiledModel = collections.namedtuple(
+    'CompiledModel', ['update', 'predict', 'source', 'n', 'm'])
+
+# model signature -> CompiledModel, least recently used first
+_CACHE = collections.OrderedDict()
+# number of compiled models kept in _CACHE
+CACHE_SIZE = 128
+
+
+def flatten(value):
+    """ Return the entries of a matrix (or nested sequences) as a tuple in
+    row-major order. """
+    if isinstance(value, Matrix):
+        value = value.value
+    return tuple(float(entry) for row in value for entry in row)
+
+
+def _rows(value):
+    """ Return a matrix as a tuple of tuples of floats. """
+    if isinstance(value, Matrix):
+        value = value.value
+    return tuple(tuple(float(entry) for entry in row) for row in value)
+
+
+def _code(entry):
+    """ Return the code of a symbolic entry (a name or a constant). """
+    if isinstance(entry, str):
+        return entry
+    entry = float(entry)
+    if math.isinf(entry) or math.isnan(entry):
+        raise ValueError("Cannot generate code for {!r}".format(entry))
+    return repr(entry)
+
+
+def _product(a, b):
+    """ Return the product of two symbolic entries, dropping zeros and ones. """
+    if a == 0 or b == 0:
+        return 0
+    if not isinstance(a, str) and not isinstance(b, str):
+        return a * b
+    if a == 1:
+        return b
+    if b == 1:
+        return a
+    return _code(a) + ' * ' + _code(b)
+
+
+def _sum(terms):
+    """ Return the sum of symbolic entries, folding the constant ones. """
+    constant = sum(term for term in terms if not isinstance(term, str))
+    symbols = [term for term in terms if isinstance(term, str)]
+    if not symbols:
+        return constant
+    if constant != 0:
+        symbols.append(_code(constant))
+    return ' + '.join(symbols)
+
+
+def _difference(a, b):
+    """ Return the difference of two symbolic entries. """
+    if b == 0:
+        return a
+    if not isinstance(a, str) and not isinstance(b, str):
+        return a - b
+    b = _code(b)
+    if ' ' in b:
+        b = '(' + b + ')'
+    return _code(a) + ' - ' + b
+
+
+def _mul(A, B):
+    """ Symbolic matrix product. """
+    columns = zip(*B)
+    return [[_sum([_product(a, b) for a, b in zip(row, col)])
+             for col in columns] for row in A]
+
+
+def _add(A, B):
+    """ Symbolic matrix sum. """
+    return [[_sum([a, b]) for a, b in zip(row_a, row_b)]
+            for row_a, row_b in zip(A, B)]
+
+
+def _sub(A, B):
+    """ Symbolic matrix difference. """
+    return [[_difference(a, b) for a, b in zip(row_a, row_b)]
+            for row_a, row_b in zip(A, B)]
+
+
+def _transpose(A):
+    """ Symbolic matrix transpose. """
+    return [list(col) for col in zip(*A)]
+
+
+def _symbols(prefix, dimx, dimy):
+    """ Return a matrix of fresh symbol names. """
+    return [["{}{}_{}".format(prefix, i, j) for j in range(dimy)]
+            for i in range(dimx)]
+
+
+def _assign(lines, prefix, M):
+    """ Emit assignments of the non constant entries of *M* to new local
+    variables and return the matrix of the assigned names. Entries which are
+    constants or already plain names are not reassigned. """
+    result = []
+    for i, row in enumerate(M):
+        new_row = []
+        for j, entry in enumerate(row):
+            if isinstance(entry, str) and ' ' in entry:
+                name = "{}{}_{}".format(prefix, i, j)
+                lines.append("    {} = {}".format(name, entry))
+                entry = name
+            new_row.append(entry)
+        result.append(new_row)
+    return result
+
+
+def _unpack(lines, symbols, source):
+    """ Emit the unpacking of the flat tuple *source* into *symbols*. """
+    names = [name for row in symbols for name in row]
+    lines.append("    {}, = {}".format(', '.join(names), source))
+
+
+def _pack(M):
+    """ Return the code of a flat tuple holding the entries of *M*. """
+    return '(' + ', '.join(_code(entry) for row in M for entry in row) + ',)'
+
+
+def _invert(S, m):
+    """ Invert the flattened *m* x *m* matrix *S*. Used by the generated code
+    for measurements with more than two dimensions. """
+    rows = [list(S[i * m:(i + 1) * m]) for i in range(m)]
+    return flatten(Matrix(rows).I)
+
+
+def _inverse(lines, S):
+    """ Emit the inversion of the symbolic matrix *S* (assigned names) and
+    return the matrix of names holding the inverse. """
+    m = len(S)
+    inverse = _symbols('si', m, m)
+    if m == 1:
+        lines.append("    si0_0 = 1.0 / {}".format(_code(S[0][0])))
+    elif m == 2:
+        (a, b), (c, d) = [[_code(entry) for entry in row] for row in S]
+        lines.append("    det = {} * {} - {} * {}".format(a, d, b, c))
+        lines.append("    si0_0 = {} / det".format(d))
+        lines.append("    si0_1 = -{} / det".format(b))
+        lines.append("    si1_0 = -{} / det".format(c))
+        lines.append("    si1_1 = {} / det".format(a))
+    else:
+        _unpack(lines, inverse, "_invert({}, {})".format(_pack(S), m))
+    return inverse
+
+
+def generate_source(A, H, Q, R):
+    """Return the source code of the ``update(x, P, z)`` and
+    ``predict(x, P)`` functions of a linear Kalman filter with the given
+    model. The generated code performs exactly the same operations as
+    :py:meth:`kfilter.LKFilter.update` and
+    :py:meth:`kfilter.LKFilter.predict`.
+
+    :param A: state transition matrix
+    :param H: observation matrix
+    :param Q: process covariance
+    :param R: measurement covariance
+    :rtype: *str*
+    """
+    A, H, Q, R = [[list(row) for row in _rows(M)] for M in (A, H, Q, R)]
+    n = len(A)
+    m = len(H)
+    x = _symbols('x', n, 1)
+    P = _symbols('p', n, n)
+    z = _symbols('z', m, 1)
+
+    lines = ["def update(x, P, z):"]
+    _unpack(lines, x, 'x')
+    _unpack(lines, P, 'P')
+    _unpack(lines, z, 'z')
+    HP = _assign(lines, 'hp', _mul(H, P))
+    S = _assign(lines, 's', _add(_mul(HP, _transpose(H)), R))
+    S_inv = _inverse(lines, S)
+    PHt = _assign(lines, 'pht', _mul(P, _transpose(H)))
+    K = _assign(lines, 'k', _mul(PHt, S_inv))
+    y = _assign(lines, 'y', _sub(z, _mul(H, x)))
+    new_x = _add(x, _mul(K, y))
+    KHP = _assign(lines, 'khp', _mul(K, HP))
+    new_P = _sub(P, KHP)
+    lines.append("    return {}, {}".format(_pack(new_x), _pack(new_P)))
+    lines.append("")
+
+    lines.append("def predict(x, P):")
+    _unpack(lines, x, 'x')
+    _unpack(lines, P, 'P')
+    AP = _assign(lines, 'ap', _mul(A, P))
+    new_x = _mul(A, x)
+    new_P = _add(_mul(AP, _transpose(A)), Q)
+    lines.append("    return {}, {}".format(_pack(new_x), _pack(new_P)))
+    lines.append("")
+    return '\n'.join(lines)
+
+
+def compile_model(A, H, Q, R):
+    """Generate, compile and cache the step functions of a linear Kalman
+    filter (see :py:func:`generate_source`). Models with the same matrices
+    share one compiled model, as long as it is one of the :py:data:`CACHE_SIZE`
+    most recently used ones.
+
+    :return: the compiled model with the fields ``update``, ``predict``,
+     ``source``, ``n`` (state dimension) and ``m`` (measurement dimension)
+    :rtype: *CompiledModel*
+    :raises ValueError: if an entry of the model is infinite or NaN
+    """
+    signature = tuple(_rows(M) for M in (A, H, Q, R))
+    try:
+        model = _CACHE.pop(signature)
+    except KeyError:
+        pass
+    else:
+        _CACHE[signature] = model
+        return model
+    if any(math.isinf(entry) or math.isnan(entry) for M in signature
+           for row in M for entry in row):
+        raise ValueError("Model entries have to be finite")
+    source = generate_source(*signature)
+    namespace = {'_invert': _invert}
+    code = compile(source, '<kfilter model {:x}>'.format(
+        hash(signature) & 0xffffffff), 'exec')
+    exec code in namespace
+    model = CompiledModel(namespace['update'], namespace['predict'], source,
+                          len(signature[0]), len(signature[1]))
+    _CACHE[signature] = model
+    while len(_CACHE) > CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return model
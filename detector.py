@@ -1,7 +1,10 @@
 """ Module implementing detectors and the detectors interaction with :py:mod:`track`. """
 # pylint: disable=C0103,R0913,W0613,W0201,W0141
 import math
-from track import Track
+from array import array
+from bisect import bisect_right
+from track import Track, TrackCollection
+from event import EventHits
 
 
 class Detector(object):
@@ -76,6 +79,93 @@ class Strip(Detector):
         self.parent = parent
 
 
+class _LayerStrip(Strip):
+
+    """ A :py:class:`.Strip` belonging to a :py:class:`.Layer`. The strip is
+    only a view: its hit count lives in the ``hit_counts`` array of the layer,
+    so strips can be created on demand and thrown away again. """
+
+    def __init__(self, layer, index):
+        # pylint: disable=W0231
+        height = layer.strip_size(index)
+        self.index = index
+        self.parent = layer
+        self.x = layer.x
+        self.y = layer.strip_centre(index)
+        self.x_err = 0
+        self.y_err = height / 12 ** 0.5
+        self.height = height
+
+    @property
+    def hits(self):
+        """ Amount of hits registered in this strip. """
+        return self.parent.hit_counts[self.index]
+
+    @hits.setter
+    def hits(self, value):
+        """ Set the amount of hits of this strip. """
+        self.parent.hit_counts[self.index] = value
+
+
+class Cluster(Detector):
+
+    """A run of adjacent fired strips of a :py:class:`.Layer`, merged into a
+    single hit candidate. Its position is the centroid of the strip centres
+    weighted by their hit counts and its error is the one of a uniform
+    distribution over the whole width of the cluster.
+
+    :param layer: the layer the strips belong to
+    :type layer: Layer
+    :param indices: indices of the fired strips, in rising order
+    :type indices: list(int)
+    :param counts: hit counts of the strips
+    :type counts: list(int)
+    :var int first: index of the lowest strip
+    :var int last: index of the highest strip
+    :var int width: number of strips spanned by the cluster
+    :var int total: sum of the hit counts of the strips
+    :var int hits: number of tracks the cluster can be assigned to, one per
+     hit of its strips (the same as :py:attr:`total`), so that tracks
+     crossing adjacent strips keep a hit each
+    """
+
+    def __init__(self, layer, indices, counts):
+        self.first = indices[0]
+        self.last = indices[-1]
+        self.width = self.last - self.first + 1
+        self.total = sum(counts)
+        centre = sum(layer.strip_centre(index) * count for index, count in
+                     zip(indices, counts)) / self.total
+        span = layer.strip_edge(self.last + 1) - layer.strip_edge(self.first)
+        super(Cluster, self).__init__(layer.x, centre,
+                                      y_err=span / 12 ** 0.5)
+        self.hits = self.total
+        self.parent = layer
+
+
+class _StripSequence(object):
+
+    """ Read-only sequence of the strips of a :py:class:`.Layer`, creating
+    each strip only when it is accessed. """
+
+    def __init__(self, layer):
+        self.layer = layer
+
+    def __len__(self):
+        return self.layer.num_strips
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("strip index out of range")
+        return self.layer.strip(index)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self.layer.strip(index)
+
+
 class Layer(Detector):
 
     """ A layer detector containing many :py:class:`.Strip` detectors, meant to
@@ -87,33 +177,201 @@ class Layer(Detector):
     Constructed strips will have *y* positions from ``y - height`` to
     ``y + height``.
 
+    The hit counts of the strips are kept in the compact integer array
+    :py:attr:`hit_counts`, the indices of the strips that fired in a set.
+    :py:class:`.Strip` objects are only created on demand - when a strip is
+    hit (for :py:attr:`hit_strips`) or accessed through :py:attr:`strips` or
+    :py:meth:`strip` - so that large geometries are cheap to build.
+
+    By default the strips are of equal height and the strip containing a
+    position is computed directly. A layer with variable pitch is built from
+    the sorted *edges* of its strips instead, the strip is then found by a
+    binary search over the edges. Strips listed in *dead* never register
+    hits, so dead regions of a real detector can be modelled by dead strips
+    spanning them.
+
     :param float x: horizontal position of detector
     :param float y: horizontal position of detector
     :param float height: the height of the whole layer
-    :param int num_strips: the amount of strips of which the layer consists -
-     they will be automatically constructed
+    :param int num_strips: the amount of strips of which the layer consists
     :param parent: a reference to the parent detector to which this strip
-     belongs."""
-
-    def __init__(self, x, y, height, num_strips, parent):
+     belongs.
+    :param edges: strictly increasing edges of the strips, from the bottom of
+     the layer (one more than the number of strips). If given, *height* and
+     *num_strips* are taken from the edges.
+    :type edges: list(float)
+    :param dead: indices of strips which do not register hits
+    :var array hit_counts: number of hits of every strip
+    :var list hit_strips: strips that have been hit, in order of their first
+     hit
+    :var float strip_height: height of the strips (the mean height if the
+     pitch is variable)
+    :var array edges: strip edges of a layer with variable pitch, ``None``
+     for equal strips"""
+
+    def __init__(self, x, y, height, num_strips, parent, edges=None,
+                 dead=()):
         super(Layer, self).__init__(x, y)
 
-        bottom = y - height * 0.5
+        if edges is not None:
+            edges = array('d', edges)
+            if len(edges) < 2 or any(
+                    upper <= lower for lower, upper in zip(edges, edges[1:])):
+                raise ValueError("Strip edges have to be strictly increasing")
+            bottom, top = edges[0], edges[-1]
+            height = top - bottom
+            num_strips = len(edges) - 1
+        else:
+            bottom = y - height * 0.5
+            top = bottom + height
         self.bottom = bottom
-        top = bottom + height
         self.top = top
+        self.height = height
         step = (top - bottom) / num_strips
         self.strip_height = step
-
-        # Create strips for this layer
-        self.strips = [None for _ in xrange(num_strips)]
-        for i in xrange(num_strips):
-            new_y = bottom + (i + 0.5) * step
-            self.strips[i] = Strip(x, new_y, step, parent=self)
-
+        self.num_strips = num_strips
+        self.edges = edges
+        self.dead = frozenset(dead)
+
+        self.hit_counts = array('i', [0]) * num_strips
+        # indices of fired strips and strips created so far
+        self._fired = set()
+        self._strips = {}
         self.hit_strips = []
         self.parent = parent
 
+    @property
+    def strips(self):
+        """ Sequence of all strips of the layer, created on access. """
+        return _StripSequence(self)
+
+    def strip(self, index):
+        """ Return the :py:class:`.Strip` with the given index (counted from
+        the bottom of the layer). """
+        try:
+            return self._strips[index]
+        except KeyError:
+            strip = self._strips[index] = _LayerStrip(self, index)
+            return strip
+
+    def strip_edge(self, index):
+        """ Return the lower edge of strip *index* (*index* equal to the
+        number of strips gives the top of the layer).
+
+        :rtype: float"""
+        if self.edges is not None:
+            return self.edges[index]
+        return self.bottom + index * self.strip_height
+
+    def strip_edges(self):
+        """ Return the edges of all strips, from the bottom of the layer.
+
+        :rtype: array"""
+        if self.edges is not None:
+            return array('d', self.edges)
+        return array('d', [self.strip_edge(index)
+                           for index in xrange(self.num_strips + 1)])
+
+    def strip_centre(self, index):
+        """ Return the *y* position of the centre of strip *index*.
+
+        :rtype: float"""
+        if self.edges is not None:
+            return 0.5 * (self.edges[index] + self.edges[index + 1])
+        return self.bottom + (index + 0.5) * self.strip_height
+
+    def strip_size(self, index):
+        """ Return the height of strip *index*.
+
+        :rtype: float"""
+        if self.edges is not None:
+            return self.edges[index + 1] - self.edges[index]
+        return self.strip_height
+
+    def strip_pos(self, index):
+        """ Return the position of the centre of strip *index* without
+        creating the strip.
+
+        :rtype: tuple(float)"""
+        return (self.x, self.strip_centre(index))
+
+    def locate(self, y):
+        """ Return the index of the strip containing position *y*, or ``None``
+        if *y* is outside of the layer or in a dead strip. Same as
+        :py:meth:`locate_many` for a single position. """
+        return self.locate_many((y,))[0]
+
+    def locate_many(self, ys):
+        """ Return the strip index of every position in *ys* (``None`` for
+        positions outside of the layer or in dead strips), computed in one
+        pass. This is the only place where positions are binned into strips,
+        so single and batched hits always agree.
+
+        :rtype: list(int)"""
+        # the layer covers [bottom, top): a position equal to the top would
+        # hit the non-existent strip above
+        bottom, top, step = self.bottom, self.top, self.strip_height
+        if self.edges is not None:
+            edges = self.edges
+            indices = [bisect_right(edges, y) - 1 if bottom <= y < top
+                       else None for y in ys]
+        else:
+            # rounding can push positions just below the top into the strip
+            # above the last one
+            last = self.num_strips - 1
+            floor = math.floor
+            indices = [min(int(floor((y - bottom) / step)), last)
+                       if bottom <= y < top else None for y in ys]
+        if self.dead:
+            dead = self.dead
+            return [None if index in dead else index for index in indices]
+        return indices
+
+    def clusters(self, max_gap=0, hits=None):
+        """Merge the fired strips of the layer into clusters of adjacent
+        strips, from the bottom of the layer. The layer is not modified.
+
+        :param int max_gap: number of unfired strips allowed inside a cluster
+        :param hits: ``(index, count)`` pairs of the fired strips to cluster
+         instead of the hits stored in the layer, e.g. from an event
+        :rtype: list(Cluster)
+        """
+        if hits is None:
+            counts = self.hit_counts
+            indices = sorted(index for index in self._fired
+                             if counts[index] > 0)
+        else:
+            counts = dict(hits)
+            indices = sorted(index for index, count in hits if count > 0)
+        clusters = []
+        start = 0
+        for end in xrange(1, len(indices) + 1):
+            if (end == len(indices) or
+                    indices[end] - indices[end - 1] > max_gap + 1):
+                run = indices[start:end]
+                clusters.append(Cluster(self, run,
+                                        [counts[index] for index in run]))
+                start = end
+        return clusters
+
+    def add_hits(self, index, count=1):
+        """ Add *count* hits to strip *index*, updating the hit counts of the
+        layer and its parent. """
+        self.hit_counts[index] += count
+        if index not in self._fired:
+            self._fired.add(index)
+            self.hit_strips.append(self.strip(index))
+        self.hits += count
+        self.parent.hits += count
+
+    def fired(self):
+        """ Return the ``(index, count)`` pairs of the strips in
+        :py:attr:`hit_strips`.
+
+        :rtype: list(tuple(int))"""
+        counts = self.hit_counts
+        return [(strip.index, counts[strip.index]) for strip in self.hit_strips]
+
     def hit(self, x, y):
         """ Increment the hit count in the correct strip. Will find the correct
         strip based on the passed *y* parameter. The *x* parameter should
@@ -124,23 +382,35 @@ class Layer(Detector):
         """
         if self.x != x:
             raise RuntimeError("Wrong x of layer")
-        # Needs to be this way for the rare case where y == self.top, because
-        # I'm going to use floor (without the equals sign it would attempt to
-        # hit the non-existant detector above).
-        if y >= self.top or y < self.bottom:
-            return
-        # Increment hits in parent(LayeredDetector) and self
-        self.parent.hit(None, None)
-        super(Layer, self).hit(x, y)
-        # Increment the proper strip and add strip to hit_strips list
-        num_strip = int(math.floor((y - self.bottom) / self.strip_height))
-        self.strips[num_strip].hit(x, y)
-        if self.strips[num_strip] not in self.hit_strips:
-            self.hit_strips.append(self.strips[num_strip])
+        num_strip = self.locate(y)
+        if num_strip is not None:
+            self.add_hits(num_strip)
+
+    def hit_many(self, ys):
+        """Hit the layer at many *y* positions at once, e.g. with the
+        intercepts of all tracks of an event. Equivalent to calling
+        :py:meth:`.hit` for every position, but the strip indices are computed
+        in one pass (:py:meth:`locate_many`) and histogrammed directly into
+        :py:attr:`hit_counts`.
+
+        :param ys: **y** positions at which the layer was hit
+        :type ys: list(float)
+        """
+        indices = [index for index in self.locate_many(ys) if index is not None]
+        counts, fired = self.hit_counts, self._fired
+        for index in indices:
+            counts[index] += 1
+            if index not in fired:
+                fired.add(index)
+                self.hit_strips.append(self.strip(index))
+        self.hits += len(indices)
+        self.parent.hits += len(indices)
 
     def clear_hits(self):
-        for strip in self.hit_strips:
-            strip.clear_hits()
+        for index in self._fired:
+            self.hit_counts[index] = 0
+        self._fired.clear()
+        self._strips = {}
         self.hit_strips = []
         self.hits = 0
 
@@ -162,9 +432,13 @@ class LayeredDetector(Detector):
      first one ``x``, last one at ``x + length``.
     :param int num_strips: the number of strips that will be constructed in
      **each** layer.
+    :param edges: optional strip edges of every layer for a variable pitch,
+     replacing *height* and *num_strips* (see :py:class:`Layer`)
+    :param dead: indices of the dead strips of every layer
     """
 
-    def __init__(self, x, y, height, length, num_layers, num_strips):
+    def __init__(self, x, y, height, length, num_layers, num_strips,
+                 edges=None, dead=()):
         super(LayeredDetector, self).__init__(x, y)
         try:
             x_step = float(length) / (num_layers - 1)
@@ -175,7 +449,32 @@ class LayeredDetector(Detector):
         self.layers = [None for _ in xrange(num_layers)]
         for i in xrange(num_layers):
             new_x = x + i * x_step
-            self.layers[i] = Layer(new_x, y, height, num_strips, parent=self)
+            self.layers[i] = Layer(new_x, y, height, num_strips, parent=self,
+                                   edges=edges, dead=dead)
+        self._sorted = None
+        self._sorted_from = None
+
+    @classmethod
+    def from_geometry(cls, geometry):
+        """Build a detector from a compiled :py:class:`geometry.Geometry`,
+        e.g. one loaded from a cache file, without recomputing the layer
+        positions.
+
+        :rtype: LayeredDetector
+        """
+        detector = cls.__new__(cls)
+        Detector.__init__(detector, geometry.x, geometry.y)
+        detector.layers = [
+            Layer(x, y, height, num_strips, parent=detector,
+                  edges=None if uniform else geometry.edges(number),
+                  dead=geometry.dead(number))
+            for number, (x, y, height, num_strips, uniform) in enumerate(zip(
+                geometry.x_layers, geometry.y_layers, geometry.height,
+                geometry.num_strips, geometry.uniform))]
+        # the layers of a geometry are already sorted
+        detector._sorted = list(detector.layers)
+        detector._sorted_from = list(detector.layers)
+        return detector
 
     @property
     def x_step(self):
@@ -189,13 +488,23 @@ class LayeredDetector(Detector):
         return x_step
 
 
+    def sort_layers(self):
+        """Sort the layers by their *x* position. The order is reused by
+        :py:meth:`get_layers` as long as :py:attr:`layers` holds the same
+        layers, and recomputed as soon as a layer is added, removed or
+        replaced. Only moving a layer requires calling this again."""
+        self._sorted = sorted(self.layers, key=lambda i: i.pos()[0])
+        self._sorted_from = list(self.layers)
+
     def get_layers(self, reverse=False):
         """Helper generator that yields the layers in the detector.
 
         :param bool reverse: toggle whether to yield in rising or falling *x*
          order """
-        # layers are sorted by x position
-        layers = sorted(self.layers, key=lambda i: i.pos()[0])
+        # layers are sorted by x position, again if the list has changed
+        if self._sorted is None or self._sorted_from != self.layers:
+            self.sort_layers()
+        layers = self._sorted
         if reverse:
             layers = reversed(layers)
         for layer in layers:
@@ -206,7 +515,9 @@ class LayeredDetector(Detector):
         the detector and red markers at every registered hit. Pulls in
         `matplotlib <http://matplotlib.org>`_ as a dependency. Additionally
         prints the positions of all hits. If *rounding* is True rounds the
-        printed floating point values to 5 decimal digits. """
+        printed floating point values to 5 decimal digits. For large
+        detectors, or machines without a display, use
+        :py:func:`display.render` instead. """
         from matplotlib import pyplot as plt
         x = []
         y = []
@@ -214,8 +525,8 @@ class LayeredDetector(Detector):
         hits_y = []
         hit_mult = []
         for layer in self.get_layers():
-            for strip in layer.strips:
-                temp_x, temp_y = strip.pos()
+            for index in xrange(layer.num_strips):
+                temp_x, temp_y = layer.strip_pos(index)
                 x.append(temp_x)
                 y.append(temp_y)
             for strip in layer.hit_strips:
@@ -251,18 +562,103 @@ class LayeredDetector(Detector):
         :type track: Track
         """
         assert isinstance(track, Track)
-        # Sort layers according to x position (just in case)
-        for layer in self.get_layers():
-            x, _ = layer.pos()
-            y = track.get_yintercept(x)
-            layer.hit(x, y)
+        layers = list(self.get_layers())
+        ys = track.get_yintercepts([layer.x for layer in layers])
+        for layer, y in zip(layers, ys):
+            layer.hit(layer.x, y)
+
+    def intercepts(self, tracks):
+        """Return the **y** intercepts of all tracks with every layer. Each
+        track is asked for the intercepts with all layers in one call of
+        :py:meth:`track.Track.get_yintercepts`, a
+        :py:class:`track.TrackCollection` (with
+        :py:meth:`track.TrackCollection.get_yintercepts_at`) for the
+        intercepts of all its tracks with one layer at a time.
+
+        :param tracks: tracks to be propagated through the detector
+        :type tracks: list(Track) or TrackCollection
+        :return: the layers in order of rising *x* and, for every layer, the
+         intercepts of all tracks
+        :rtype: *tuple(list)*
+        """
+        layers = list(self.get_layers())
+        if isinstance(tracks, TrackCollection):
+            return layers, [tracks.get_yintercepts_at(layer.x)
+                            for layer in layers]
+        xs = [layer.x for layer in layers]
+        rows = [track.get_yintercepts(xs) for track in tracks]
+        if not rows:
+            return layers, [[] for _ in layers]
+        return layers, [list(column) for column in zip(*rows)]
+
+    def event_hits(self):
+        """Return the hits currently stored in the detector as an
+        :py:class:`event.EventHits` snapshot. Layers are numbered in order of
+        rising *x*, the records of each layer follow :py:attr:`Layer.hit_strips`.
+
+        :rtype: EventHits
+        """
+        hits = EventHits()
+        for number, layer in enumerate(self.get_layers()):
+            for index, count in layer.fired():
+                hits.append(number, index, count)
+        return hits
+
+    def load_event(self, hits):
+        """Replace the hits stored in the detector by the hits of an event,
+        e.g. to fit it with :py:class:`fitter.FitManager`.
+
+        :param hits: the event, an :py:class:`event.EventHits` or any iterable
+         of ``(layer, strip, count)`` records
+        """
+        self.clear_hits()
+        layers = list(self.get_layers())
+        for layer, strip, count in hits:
+            layers[layer].add_hits(strip, count)
+
+    def simulate(self, tracks, track_ids=False):
+        """Propagate tracks through the detector without touching its hit
+        counters and return the resulting event. With *track_ids* every hit
+        becomes its own record (with a count of one) carrying the index of the
+        track in *tracks*, otherwise the hits of each strip are merged into one
+        record.
+
+        :param tracks: tracks to be propagated through the detector
+        :type tracks: list(Track) or TrackCollection
+        :param bool track_ids: toggle recording of the true track ids
+        :rtype: EventHits
+        """
+        hits = EventHits(track=[] if track_ids else None)
+        layers, intercepts = self.intercepts(tracks)
+        for number, (layer, ys) in enumerate(zip(layers, intercepts)):
+            indices = layer.locate_many(ys)
+            if track_ids:
+                for track_id, index in enumerate(indices):
+                    if index is not None:
+                        hits.append(number, index, 1, track_id)
+                continue
+            counts = {}
+            order = []
+            for index in indices:
+                if index is None:
+                    continue
+                if index not in counts:
+                    counts[index] = 0
+                    order.append(index)
+                counts[index] += 1
+            for index in order:
+                hits.append(number, index, counts[index])
+        return hits
 
     def propagate_tracks(self, tracks):
-        """Propagate all tracks from a list, leaving hits in the detector.
+        """Propagate all tracks from a list, leaving hits in the detector. The
+        intercepts with all layers are computed at once (see
+        :py:meth:`intercepts`) and each layer receives the intercepts of all
+        tracks in one batch (see :py:meth:`Layer.hit_many`).
 
         :param tracks: tracks to be propagated through the detector
-        :type tracks: list(Track)
+        :type tracks: list(Track) or TrackCollection
         """
-        assert isinstance(tracks, list)
-        for track in tracks:
-            self.propagate_track(track)
+        assert isinstance(tracks, (list, TrackCollection))
+        for layer, ys in zip(*self.intercepts(tracks)):
+            layer.hit_many(ys)
@@ -0,0 +1,166 @@
+"""
+Headless event display. :py:func:`render` draws a
+:py:class:`detector.LayeredDetector` with its hits (and optionally fitted
+tracks) straight into an image file, without opening a window, so it works on
+machines without a display. The file format is chosen by the extension of the
+file name (``.png``, ``.svg``, ...).
+
+Unlike :py:meth:`detector.LayeredDetector.draw` the amount of drawing does not
+grow with the number of strips: every layer is a single line segment, and when
+an event has more fired strips than *max_markers* the hits are summed into a
+two dimensional histogram that is drawn as one image::
+
+    >>> ftr = FitManager(det, filt)
+    >>> ftr.fit(hits)
+    >>> render(det, 'event.png', event=hits, tracks=ftr.propagate_tracks())
+
+Needs `matplotlib <http://matplotlib.org>`_ (and therefore numpy), which is
+only imported by :py:func:`render`.
+"""
+# pylint: disable=C0103,R0913,R0914
+from array import array
+from event import EventHits
+
+
+def _columns(event):
+    """ Return the ``(layer, strip, count)`` columns of an event as arrays,
+    without copying them if it is an :py:class:`event.EventHits`. """
+    if hasattr(event, 'hits'):
+        event = event.hits()
+    if isinstance(event, EventHits):
+        return event.layer, event.strip, event.count
+    columns = array('i'), array('i'), array('i')
+    for record in event:
+        for column, value in zip(columns, record):
+            column.append(value)
+    return columns
+
+
+def _layer_geometry(layers):
+    """ Return the **x** positions, bottoms and strip heights of layers. """
+    return ([layer.x for layer in layers],
+            [layer.bottom for layer in layers],
+            [layer.strip_height for layer in layers])
+
+
+def _density_grid(layers, bins):
+    """Return the numbers of density bins along **x** and **y** and the
+    ``(left, right, bottom, top)`` extent of the density image of *layers*.
+    Bins along **x** never outnumber the layers, and layers sit at the bin
+    centres when there is one bin per layer. """
+    left = min(layer.x for layer in layers)
+    right = max(layer.x for layer in layers)
+    nx = max(1, min(bins[0], len(layers)))
+    half = (right - left) / (2.0 * (nx - 1)) if nx > 1 else 0.5
+    return nx, bins[1], (left - half, right + half,
+                         min(layer.bottom for layer in layers),
+                         max(layer.top for layer in layers))
+
+
+def hit_positions(detector, event=None):
+    """Return the centres of the fired strips of an event and their hit
+    counts as three parallel arrays.
+
+    :param detector: detector the event was recorded with
+    :type detector: LayeredDetector
+    :param event: an :py:class:`event.EventHits`, an
+     :py:class:`eventio.EventView` or any iterable of ``(layer, strip,
+     count)`` records, defaults to the hits stored in the detector
+    :return: **x** and **y** positions and counts
+    :rtype: *tuple(array)*
+    """
+    if event is None:
+        event = detector.event_hits()
+    layer, strip, count = _columns(event)
+    layers = list(detector.get_layers())
+    x, bottom, step = _layer_geometry(layers)
+    xs = array('d', [x[i] for i in layer])
+    if all(item.edges is None for item in layers):
+        ys = array('d', [bottom[i] + (index + 0.5) * step[i]
+                         for i, index in zip(layer, strip)])
+    else:
+        ys = array('d', [layers[i].strip_centre(index)
+                         for i, index in zip(layer, strip)])
+    return xs, ys, array('i', count)
+
+
+def render(detector, path, event=None, tracks=None, max_markers=5000,
+           bins=(200, 400), size=(8, 6), dpi=100, title="Layered Detector"):
+    """Draw a detector and the hits of an event into an image file.
+
+    Layers are drawn as blue line segments. Hits are drawn as red markers
+    (sized by their multiplicity) if there are at most *max_markers* fired
+    strips, otherwise as a density image with *bins* bins. Bins along **x**
+    never outnumber the layers, so every layer keeps its own column when
+    possible.
+
+    :param detector: detector to draw
+    :type detector: LayeredDetector
+    :param str path: output file, its extension selects the format
+    :param event: hits to draw (see :py:func:`hit_positions`), defaults to the
+     hits stored in the detector
+    :param tracks: optional tracks to overlay, each one a list of ``(x, y)``
+     pairs as returned by :py:meth:`fitter.FitManager.propagate_tracks`
+    :param int max_markers: largest number of fired strips drawn as markers
+    :param bins: number of density bins along **x** and **y**
+    :param size: figure size in inches
+    :param int dpi: resolution of raster formats
+    :param str title: title of the figure
+    """
+    import numpy
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+
+    layers = list(detector.get_layers())
+    fig = Figure(figsize=size)
+    FigureCanvasAgg(fig)
+    axes = fig.add_subplot(111)
+    axes.set_title(title)
+    axes.set_xlabel("x")
+    axes.set_ylabel("y")
+
+    axes.add_collection(LineCollection(
+        [((layer.x, layer.bottom), (layer.x, layer.top)) for layer in layers],
+        colors='b', linewidths=0.5))
+    left = min(layer.x for layer in layers)
+    right = max(layer.x for layer in layers)
+    bottom = min(layer.bottom for layer in layers)
+    top = max(layer.top for layer in layers)
+    margin = 0.05 * (right - left) or 0.5
+    axes.set_xlim(left - margin, right + margin)
+    axes.set_ylim(bottom, top)
+
+    if event is None:
+        event = detector.event_hits()
+    columns = _columns(event)
+    if len(columns[0]) <= max_markers:
+        xs, ys, counts = hit_positions(detector, EventHits(*columns))
+        axes.scatter(xs, ys, s=[9 * count for count in counts], color='r',
+                     zorder=3)
+    else:
+        layer, strip, count = [numpy.frombuffer(column, dtype=numpy.intc)
+                               for column in columns]
+        if all(item.edges is None for item in layers):
+            xs, lows, steps = [numpy.array(values)
+                               for values in _layer_geometry(layers)]
+            xs, ys = xs[layer], lows[layer] + (strip + 0.5) * steps[layer]
+        else:
+            positions = hit_positions(detector, EventHits(*columns))[:2]
+            xs, ys = [numpy.frombuffer(values, dtype=numpy.float64)
+                      for values in positions]
+        nx, ny, extent = _density_grid(layers, bins)
+        values, _, _ = numpy.histogram2d(
+            xs, ys, bins=(nx, ny), range=(extent[:2], extent[2:]), weights=count)
+        image = numpy.ma.masked_equal(values.T, 0)
+        mapped = axes.imshow(image, extent=extent, origin='lower',
+                             aspect='auto', interpolation='nearest',
+                             cmap='Reds', zorder=2)
+        fig.colorbar(mapped, ax=axes, label="hits")
+
+    if tracks:
+        axes.add_collection(LineCollection(
+            [list(track) for track in tracks], colors='g', linewidths=1.0,
+            zorder=4))
+
+    fig.savefig(path, dpi=dpi)
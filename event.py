@@ -0,0 +1,135 @@
+"""
+Module implementing the columnar hit buffer of an event. An event is stored
+as a structure of arrays (:py:class:`EventHits`) instead of hit counters
+scattered over the strips of a detector, so many events can be held, sliced,
+concatenated and batched at the same time without any per-hit Python
+objects.
+"""
+# pylint: disable=C0103
+from array import array
+
+
+class EventHits(object):
+
+    """The hits of one event (or of a batch of events) as parallel integer
+    arrays. Record *i* says that strip ``strip[i]`` of layer ``layer[i]`` was
+    hit ``count[i]`` times. Layers are numbered in order of rising *x*, as
+    returned by :py:meth:`detector.LayeredDetector.get_layers`, strips from
+    the bottom of the layer. Optionally the records carry the id of the true
+    track that caused them (``track``), in which case every record usually
+    has a count of one.
+
+    Iterating over the hits yields ``(layer, strip, count)`` tuples, slicing
+    returns a new :py:class:`EventHits`::
+
+        >>> hits = detector.simulate(tracks)
+        >>> len(hits)
+        42
+        >>> first_layer = hits.select(0)
+        >>> for layer, strip, count in hits[:10]:
+        ...     pass
+
+    :param layer: layer index of each record
+    :param strip: strip index of each record
+    :param count: multiplicity of each record
+    :param track: optional true track id of each record
+    """
+
+    def __init__(self, layer=(), strip=(), count=(), track=None):
+        self.layer = array('i', layer)
+        self.strip = array('i', strip)
+        self.count = array('i', count)
+        self.track = None if track is None else array('i', track)
+        lengths = set([len(self.layer), len(self.strip), len(self.count)])
+        if self.track is not None:
+            lengths.add(len(self.track))
+        if len(lengths) != 1:
+            raise ValueError("Columns are not the same length")
+
+    def __len__(self):
+        return len(self.layer)
+
+    def __iter__(self):
+        return iter(zip(self.layer, self.strip, self.count))
+
+    def __getitem__(self, key):
+        """ Return record *key* as a ``(layer, strip, count)`` tuple, or a new
+        :py:class:`EventHits` if *key* is a slice. """
+        if isinstance(key, slice):
+            return EventHits(self.layer[key], self.strip[key], self.count[key],
+                             None if self.track is None else self.track[key])
+        return (self.layer[key], self.strip[key], self.count[key])
+
+    def __eq__(self, other):
+        return (isinstance(other, EventHits) and
+                (self.layer, self.strip, self.count, self.track) ==
+                (other.layer, other.strip, other.count, other.track))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "{}({} records, {} hits)".format(
+            self.__class__.__name__, len(self), self.total())
+
+    def append(self, layer, strip, count=1, track=None):
+        """ Append a record. *track* has to be given if (and only if) the hits
+        carry track ids. """
+        if (track is None) != (self.track is None):
+            raise ValueError("Track id mismatch")
+        self.layer.append(layer)
+        self.strip.append(strip)
+        self.count.append(count)
+        if track is not None:
+            self.track.append(track)
+
+    def total(self):
+        """ Return the total number of hits (sum of the multiplicities). """
+        return sum(self.count)
+
+    def select(self, layer):
+        """ Return the records of one layer as a new :py:class:`EventHits`. """
+        rows = [i for i, value in enumerate(self.layer) if value == layer]
+        return EventHits([self.layer[i] for i in rows],
+                         [self.strip[i] for i in rows],
+                         [self.count[i] for i in rows],
+                         None if self.track is None else
+                         [self.track[i] for i in rows])
+
+    @classmethod
+    def concatenate(cls, events):
+        """ Return all records of *events* in one :py:class:`EventHits`. Track
+        ids are kept only if all events carry them. """
+        events = list(events)
+        result = cls()
+        with_tracks = bool(events) and all(event.track is not None
+                                           for event in events)
+        if with_tracks:
+            result.track = array('i')
+        for event in events:
+            result.layer.extend(event.layer)
+            result.strip.extend(event.strip)
+            result.count.extend(event.count)
+            if with_tracks:
+                result.track.extend(event.track)
+        return result
+
+    @classmethod
+    def batch(cls, events):
+        """Concatenate many events into one buffer, remembering where each
+        event starts. The inverse operation is :py:meth:`split`.
+
+        :return: the concatenated hits and the offsets of the events (one more
+         than the number of events, the last one is the total length)
+        :rtype: *tuple(EventHits, array)*
+        """
+        events = list(events)
+        offsets = array('l', [0])
+        for event in events:
+            offsets.append(offsets[-1] + len(event))
+        return cls.concatenate(events), offsets
+
+    def split(self, offsets):
+        """ Split a batch created by :py:meth:`batch` back into events. """
+        return [self[start:stop] for start, stop in zip(offsets[:-1],
+                                                         offsets[1:])]
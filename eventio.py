@@ -0,0 +1,285 @@
+"""
+Module implementing a compact binary file format for events. A file holds the
+parameters of the :py:class:`detector.LayeredDetector` the events were
+recorded with, the packed ``(layer, strip, count)`` records of all events and
+an index with the position of every event. All numbers are little-endian.
+
+====================  ======================================================
+header (64 bytes)     magic ``JKEV``, format version, geometry
+                      (*x*, *y*, *height*, *length*, *num_layers*,
+                      *num_strips*), number of events, offset of the index
+records               three 32 bit integers (layer, strip, count) per record
+index                 64 bit offsets of the first record and of the end of
+                      the records of every event, as pairs
+====================  ======================================================
+
+Events are written with an :py:class:`EventWriter`, which buffers the records
+and writes the index when it is closed. Opening an existing file with a
+writer appends to it: the new records and then the new index are written
+after the old index, and only then the header is pointed at the new index, so
+the file stays readable (with the old events) if the writer is not closed.
+The old index is left behind as unused bytes. An :py:class:`EventReader` maps
+the file into memory and gives random access to the events::
+
+    >>> with EventWriter('events.jkev', detector) as writer:
+    ...     for tracks in samples:
+    ...         writer.write(detector.simulate(tracks))
+    ...
+    >>> reader = EventReader('events.jkev')
+    >>> fitter.fit(reader[17])
+
+Files of version 1, whose index holds only the ``number of events + 1``
+offsets of contiguous events, can still be read and appended to.
+"""
+# pylint: disable=C0103
+import mmap
+import os
+import struct
+import sys
+from array import array
+from event import EventHits
+
+MAGIC = b'JKEV'
+VERSION = 2
+_HEADER = struct.Struct('<4sHH4d2iQQ')
+_RECORD = struct.Struct('<iii')
+# bytes of one record
+RECORD_SIZE = _RECORD.size
+
+
+def geometry(detector):
+    """ Return the construction parameters (*x*, *y*, *height*, *length*,
+    *num_layers*, *num_strips*) of a :py:class:`detector.LayeredDetector`.
+
+    :rtype: tuple"""
+    layers = list(detector.get_layers())
+    first, last = layers[0], layers[-1]
+    return (float(detector.x), float(detector.y),
+            float(first.top - first.bottom), float(last.x - first.x),
+            len(layers), first.num_strips)
+
+
+def _to_bytes(values):
+    """ Return an ``array('i')`` as little-endian bytes. """
+    if sys.byteorder == 'big':
+        values = array('i', values)
+        values.byteswap()
+    return values.tostring()
+
+
+def pack(hits):
+    """ Return the records of an event as they are stored in event files.
+
+    :param hits: the event, an :py:class:`event.EventHits` or any iterable of
+     ``(layer, strip, count)`` records
+    :rtype: str"""
+    if isinstance(hits, EventHits):
+        packed = array('i', [0]) * (3 * len(hits))
+        packed[0::3] = hits.layer
+        packed[1::3] = hits.strip
+        packed[2::3] = hits.count
+    else:
+        packed = array('i', [value for record in hits
+                             for value in record[:3]])
+    return _to_bytes(packed)
+
+
+class EventWriter(object):
+
+    """Buffered writer of event files. If the file already exists, the new
+    events are appended to it (its geometry has to match).
+
+    :param str path: file name
+    :param detector: the detector, or its geometry as returned by
+     :py:func:`geometry`, only needed for new files
+    :param int buffer_size: number of bytes collected before they are written
+    """
+
+    def __init__(self, path, detector=None, buffer_size=1 << 20):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+        if detector is not None and not isinstance(detector, tuple):
+            detector = geometry(detector)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            reader = EventReader(path)
+            if detector is not None and detector != reader.geometry:
+                reader.close()
+                raise ValueError("Geometry does not match the file")
+            self.geometry = reader.geometry
+            self.starts = array('l', reader.starts)
+            self.stops = array('l', reader.stops)
+            reader.close()
+            # the file is left untouched until the new index is written
+            self._file = open(path, 'r+b')
+            self._end = os.path.getsize(path)
+        else:
+            if detector is None:
+                raise ValueError("New files need a geometry")
+            self.geometry = detector
+            self.starts = array('l')
+            self.stops = array('l')
+            self._file = open(path, 'w+b')
+            self._write_header(0)
+            self._end = _HEADER.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _write_header(self, index_offset):
+        """ Write the header at the start of the file. """
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, 0, *(
+            self.geometry + (len(self), index_offset))))
+
+    def write(self, hits):
+        """ Append one event.
+
+        :param hits: the event, an :py:class:`event.EventHits` or any iterable
+         of ``(layer, strip, count)`` records
+        """
+        data = pack(hits)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self.starts.append(self._end)
+        self._end += len(data)
+        self.stops.append(self._end)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered records to the file. """
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(b''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        """ Write the remaining records and the index, and close the file.
+        The header is updated last, after the index is on disk. """
+        if self._file is None:
+            return
+        self.flush()
+        index = array('l', [0]) * (2 * len(self))
+        index[0::2] = self.starts
+        index[1::2] = self.stops
+        self._file.write(struct.pack('<{}Q'.format(len(index)), *index))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._write_header(self._end)
+        self._file.close()
+        self._file = None
+
+
+class EventView(object):
+
+    """A read-only view of one event in a memory mapped file. Nothing is
+    copied until the records are accessed: iterating yields
+    ``(layer, strip, count)`` tuples straight from the mapped file, so a view
+    can be passed to :py:meth:`detector.LayeredDetector.load_event` or
+    :py:meth:`fitter.FitManager.fit`. :py:meth:`hits` converts the view into
+    an :py:class:`event.EventHits`.
+    """
+
+    def __init__(self, buf, start, stop):
+        self._buf = buf
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return (self.stop - self.start) // _RECORD.size
+
+    def __iter__(self):
+        unpack, buf = _RECORD.unpack_from, self._buf
+        for offset in xrange(self.start, self.stop, _RECORD.size):
+            yield unpack(buf, offset)
+
+    def hits(self):
+        """ Return the records as an :py:class:`event.EventHits`. """
+        values = array('i')
+        values.fromstring(self._buf[self.start:self.stop])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return EventHits(values[0::3], values[1::3], values[2::3])
+
+
+class EventReader(object):
+
+    """Memory mapped reader of event files, giving random access to the events
+    by their number. Indexing returns an :py:class:`EventView`, iterating
+    streams the views of all events in order.
+
+    :param str path: file name
+    :var tuple geometry: the parameters of the detector (see
+     :py:func:`geometry`)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            header = _HEADER.unpack_from(self._map, 0)
+            magic, version = header[:2]
+            if magic != MAGIC:
+                raise IOError("Not an event file: {}".format(path))
+            if version > VERSION:
+                raise IOError(
+                    "Unsupported event file version {}".format(version))
+            self.geometry = header[3:9]
+            num_events, index_offset = header[9:]
+            if index_offset == 0:
+                raise IOError("Event file was not closed: {}".format(path))
+            if version == 1:
+                offsets = struct.unpack_from(
+                    '<{}Q'.format(num_events + 1), self._map, index_offset)
+                self.starts = array('l', offsets[:-1])
+                self.stops = array('l', offsets[1:])
+            else:
+                index = struct.unpack_from(
+                    '<{}Q'.format(2 * num_events), self._map, index_offset)
+                self.starts = array('l', index[0::2])
+                self.stops = array('l', index[1::2])
+        except (ValueError, struct.error):
+            # empty or truncated file
+            self.close()
+            raise IOError("Not an event file: {}".format(path))
+        except IOError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError("event number out of range")
+        return EventView(self._map, self.starts[number], self.stops[number])
+
+    def __iter__(self):
+        for number in xrange(len(self)):
+            yield self[number]
+
+    def close(self):
+        """ Unmap and close the file. """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
@@ -1,11 +1,250 @@
 """
 Fitting module: fit tracks to hits contained within a detector with the help
 of Kalman Filters.
+
+Many events are fitted in parallel with :py:meth:`FitManager.fit_many`.
+Nothing but file positions goes through the pipes of the process pool: the
+records of the events are memory mapped by the workers, straight from an
+event file (see :py:mod:`eventio`) or from a scratch file the events are
+streamed into, and the fitted tracks are packed into :py:class:`FitResult`
+arrays which the workers append to files of their own, mapped back by the
+parent process::
+
+    >>> ftr = FitManager(det_obj, filt_obj)
+    >>> for result in ftr.fit_many(EventReader('events.jkev'), workers=8):
+    ...     tracks = result.measurements_list
 """
+# pylint: disable=C0103,R0913,R0914
+import collections
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
 from matrix import Matrix
 from detector import Detector
+from hitindex import HitIndex
 from kfilter import TwoWayLKFilter
+from assignment import assign
+from eventio import EventReader, EventView, RECORD_SIZE, geometry, pack
 from copy import copy
+from array import array
+
+# sizes of the packed results, see FitResult.tostring
+_SIZES = struct.Struct('=qqq')
+
+# records fitted by one task when streaming events to the workers
+_CHUNK_RECORDS = 4096
+
+# manager, mapped files and result file of a worker process, set by
+# _init_worker
+_WORKER = {}
+
+
+def _scaled(matrix, factor):
+    """ Return a copy of *matrix* with all entries multiplied by *factor*. """
+    return Matrix([[entry * factor for entry in row] for row in matrix.value])
+
+
+class FitResult(object):
+
+    """The tracks fitted in one event, packed into flat arrays. With a state
+    vector of *dimension* entries, track *i* owns the measurements
+    ``values[offsets[i]:offsets[i + 1]]`` (``NaN`` for layers without a hit)
+    and the ``dimension * (dimension + 1)`` entries of :py:attr:`states`
+    starting at ``i * dimension * (dimension + 1)``: the final state vector
+    **x** followed by the rows of its covariance **P**. A result converts to
+    and from a byte string without pickling (:py:meth:`tostring`,
+    :py:meth:`fromstring`).
+
+    :param int dimension: size of the state vector
+    :param offsets: position of the first measurement of every track, plus
+     the end of the last track
+    :param values: measurements of all tracks
+    :param states: final states and covariances of all tracks
+    """
+
+    def __init__(self, dimension, offsets=(0,), values=(), states=()):
+        self.dimension = dimension
+        self.offsets = array('l', offsets)
+        self.values = array('d', values)
+        self.states = array('d', states)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __eq__(self, other):
+        return (isinstance(other, FitResult) and
+                self.tostring() == other.tostring())
+
+    def __ne__(self, other):
+        return not self == other
+
+    @classmethod
+    def from_filters(cls, fitters, dimension):
+        """ Pack the fitted filters returned by :py:meth:`FitManager.fit`.
+
+        :param int dimension: size of the state vectors of the filters
+        :rtype: FitResult"""
+        result = cls(dimension)
+        nan = float('nan')
+        for fitter in fitters:
+            result.values.extend([nan if measurement is None else
+                                  measurement[0][0]
+                                  for measurement in fitter.measurements])
+            result.offsets.append(len(result.values))
+            x, P = fitter.state
+            result.states.extend([row[0] for row in x.value])
+            for row in P.value:
+                result.states.extend(row)
+        return result
+
+    def measurements(self, number):
+        """ Return the measurements of track *number*, ``None`` for layers
+        without a hit.
+
+        :rtype: list(float)"""
+        return [None if value != value else value for value in
+                self.values[self.offsets[number]:self.offsets[number + 1]]]
+
+    @property
+    def measurements_list(self):
+        """ The measurements of all tracks, rounded to 5 decimal digits like
+        :py:attr:`kfilter.LKFilter.measurements_list`.
+
+        :rtype: *list(list(float))*"""
+        return [[None if value is None else round(value, 5)
+                 for value in self.measurements(number)]
+                for number in xrange(len(self))]
+
+    def state(self, number):
+        """ Return the final state vector **x** and covariance **P** of track
+        *number*.
+
+        :rtype: *tuple(Matrix)*"""
+        n = self.dimension
+        start = number * n * (n + 1)
+        x = self.states[start:start + n]
+        P = self.states[start + n:start + n * (n + 1)]
+        return (Matrix([list(x)]).T,
+                Matrix([list(P[i * n:(i + 1) * n]) for i in xrange(n)]))
+
+    def tostring(self):
+        """ Return the result as a byte string in native byte order.
+
+        :rtype: str"""
+        return b''.join((_SIZES.pack(self.dimension, len(self),
+                                     len(self.values)),
+                         self.offsets.tostring(), self.values.tostring(),
+                         self.states.tostring()))
+
+    @classmethod
+    def fromstring(cls, data):
+        """ Unpack a result packed by :py:meth:`tostring`.
+
+        :rtype: FitResult"""
+        dimension, tracks, length = _SIZES.unpack_from(data, 0)
+        result = cls(dimension, ())
+        offset = _SIZES.size
+        for values, size in ((result.offsets, tracks + 1),
+                             (result.values, length),
+                             (result.states,
+                              tracks * dimension * (dimension + 1))):
+            stop = offset + size * values.itemsize
+            values.fromstring(data[offset:stop])
+            offset = stop
+        return result
+
+
+def _mapped(maps, path, size):
+    """ Return a read-only map of the file *path* holding at least *size*
+    bytes, mapping it again if the file has grown since it was mapped. """
+    buf = maps.get(path)
+    if buf is None or len(buf) < size:
+        if buf is not None:
+            buf.close()
+        with open(path, 'rb') as handle:
+            buf = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        maps[path] = buf
+    return buf
+
+
+def _init_worker(manager, directory):
+    """ Store the manager and open the result file of a worker process. """
+    _WORKER['manager'] = manager
+    _WORKER['maps'] = {}
+    path = os.path.join(directory, 'results-{}'.format(os.getpid()))
+    _WORKER['results'] = path, open(path, 'wb')
+
+
+def _fit_chunk(task):
+    """Fit a chunk of events in a worker process. The task names a file and
+    the byte ranges of the records of the events in it. The packed results
+    are appended to the result file of the worker, whose name is returned
+    with their position and lengths."""
+    path, ranges = task
+    manager = _WORKER['manager']
+    # empty files cannot be mapped, and events without records need no map
+    buf = (_mapped(_WORKER['maps'], path, ranges[-1][1])
+           if ranges[-1][1] > ranges[0][0] else b'')
+    result_path, results = _WORKER['results']
+    offset = results.tell()
+    lengths = []
+    for start, stop in ranges:
+        data = manager.fit_packed(EventView(buf, start, stop)).tostring()
+        results.write(data)
+        lengths.append(len(data))
+    results.flush()
+    return result_path, offset, lengths
+
+
+def _unpack(maps, reply):
+    """ Read the results of a chunk from the result file of a worker. """
+    path, offset, lengths = reply
+    buf = _mapped(maps, path, offset + sum(lengths))
+    results = []
+    for length in lengths:
+        results.append(FitResult.fromstring(buf[offset:offset + length]))
+        offset += length
+    return results
+
+
+def _stream(events, spool, size):
+    """ Append the records of *events* to the open scratch file *spool*,
+    yielding the byte ranges of the events in chunks of at least *size*
+    records. """
+    ranges = []
+    records = 0
+    offset = spool.tell()
+    for event in events:
+        data = pack(event)
+        spool.write(data)
+        ranges.append((offset, offset + len(data)))
+        offset += len(data)
+        records += len(data) // RECORD_SIZE
+        if records >= size:
+            spool.flush()
+            yield ranges
+            ranges, records = [], 0
+    if ranges:
+        spool.flush()
+        yield ranges
+
+
+def _chunks(sizes, size):
+    """ Split events with *sizes* records into ranges of consecutive events
+    holding at least *size* records each (except the last one). """
+    chunks = []
+    start = total = 0
+    for number, records in enumerate(sizes):
+        total += records
+        if total >= size:
+            chunks.append((start, number + 1))
+            start, total = number + 1, 0
+    if start < len(sizes):
+        chunks.append((start, len(sizes)))
+    return chunks
 
 
 class FitManager(object):
@@ -21,24 +260,85 @@ class FitManager(object):
      fitted
     :param TwoWayLKFilter filt_obj: a Kalman filter object using which the tracks
      will be fitted.
+    :param bool clustering: merge adjacent fired strips into
+     :py:class:`detector.Cluster` candidates (see
+     :py:meth:`detector.Layer.clusters`) instead of treating every strip as a
+     separate hit. The measurement covariance **R** of the filter, which
+     describes a single strip of the mean pitch of the layer, is scaled by
+     the squared ratio of the error of the cluster (see
+     :py:class:`detector.Cluster`) to the error of such a strip, so clusters
+     of narrow and wide strips are weighted by their actual span.
+    :param str assignment: how hits are assigned to the filters in each
+     layer. ``'global'`` chooses the assignment with the smallest total
+     :math:`\chi^2` distance (see :py:func:`assignment.assign`), so it does
+     not depend on the order of the filters. ``'greedy'`` lets every filter,
+     in order, take the nearest remaining hit.
+    :param float gate: largest :math:`\chi^2` distance between a hit and
+     the position predicted by a filter (using the variance of the
+     prediction) for the hit to be assigned
     """
 
-    def __init__(self, det_obj, filt_obj):
+    def __init__(self, det_obj, filt_obj, clustering=False,
+                 assignment='global', gate=9.0):
         assert isinstance(det_obj, Detector)
         assert isinstance(filt_obj, TwoWayLKFilter)
+        if assignment not in ('global', 'greedy'):
+            raise ValueError("Unknown assignment: {}".format(assignment))
         self.detector = det_obj
         self.filt = filt_obj
+        self.clustering = clustering
+        self.assignment = assignment
+        self.gate = gate
         filt_obj.reverse()
         self.fitters = []
 
-    def _new_filters(self, layer):
+    def _records(self, event):
+        """Group the records of an event by layer. Records of the same strip
+        are merged, keeping the order of their first appearance.
+
+        :return: ``(index, count)`` pairs of every layer, in order of rising
+         *x*
+        :rtype: *list(list(tuple(int)))*
+        """
+        if event is None:
+            event = self.detector.event_hits()
+        counts = [{} for _ in self.detector.get_layers()]
+        records = [[] for _ in counts]
+        for layer, strip, count in event:
+            if strip not in counts[layer]:
+                counts[layer][strip] = 0
+                records[layer].append(strip)
+            counts[layer][strip] += count
+        return [[(strip, layer_counts[strip]) for strip in strips]
+                for strips, layer_counts in zip(records, counts)]
+
+    def _candidates(self, layer, records):
+        """Return the hit candidates of a layer as parallel arrays of their
+        *y* positions, their numbers of unassigned hits and the factors by
+        which their measurement variance exceeds the one of a strip of the
+        mean pitch. The candidates are the fired strips, or their clusters if
+        clustering is enabled. The arrays belong to the current fit only."""
+        if self.clustering:
+            clusters = layer.clusters(hits=records)
+            strip_err = layer.strip_height / 12 ** 0.5
+            return (array('d', [cluster.y for cluster in clusters]),
+                    array('i', [cluster.hits for cluster in clusters]),
+                    array('d', [(cluster.y_err / strip_err) ** 2
+                                for cluster in clusters]))
+        return (array('d', [layer.strip_centre(index)
+                            for index, _ in records]),
+                array('i', [count for _, count in records]),
+                array('d', [1.0]) * len(records))
+
+    def _new_filters(self, layer, positions, remaining, active):
         """Spawn new filters for hits that could not be assigned to existing
         filters."""
-        for strip in layer.hit_strips:
-            for i in xrange(strip.hits):
+        x = layer.x
+        for candidate in active:
+            y = positions[candidate]
+            for i in xrange(remaining[candidate]):
                 # Create a copy of the filter (all the same matrices)
                 kfilter = copy(self.filt)
-                x, y = strip.pos()
                 # initialize with first hit
                 state = Matrix([[y, y / x]]).T
                 cov = Matrix([[10.0, 0.0],
@@ -48,15 +348,46 @@ class FitManager(object):
                 kfilter.state = state, cov
                 self.fitters.append(kfilter)
                 kfilter.step(add=True)
-        layer.clear_hits()
 
-    def fit(self):
+    def _greedy(self, predictions, variances, positions, remaining):
+        """Assign hits greedily: every filter, in order, takes the candidate
+        nearest to its prediction among those with unassigned hits, if it is
+        inside the gate. The nearest candidate is found by binary search in a
+        :py:class:`hitindex.HitIndex`.
+
+        :return: the candidate of every filter, ``None`` for no hit
+        :rtype: list(int)
+        """
+        index = HitIndex(positions, remaining)
+        choices = []
+        for predicted_y, y_err in zip(predictions, variances):
+            # find the strip that minimizes the distance to the predicted
+            # y position
+            candidate = index.nearest(predicted_y)
+            # allow for 3 sigma distance by default (y_err is the variance)
+            if (candidate is None or (positions[candidate] - predicted_y) ** 2
+                    > self.gate * y_err):
+                choices.append(None)
+                continue
+            choices.append(candidate)
+            index.use(candidate)
+        return choices
+
+    def fit(self, event=None):
         """Perform a fit of the hits in the detector using the supplied
-        Kalman filter. After tracks have been fitted to the hits, this method
+        Kalman filter. If an *event* is passed, its hits are fitted instead.
+        After tracks have been fitted to the hits, this method
         returns a list of Kalman filter objects, each of which contains the
         hits that have been assigned to it. The filters are in the state
         corresponding to the *x* position one layer distance past the first layer.
 
+        The hits are only read: which hits have been assigned is kept in
+        arrays private to the fit, so neither the detector nor the event is
+        modified. The same event can therefore be fitted again (e.g. with a
+        different configuration), and several managers can fit events of the
+        same detector at the same time. Each call replaces the filters of the
+        previous fit.
+
         Before the filters are returned, the ones with less than 3 measurements
         assigned to them are removed as unreliable fits. The quickest way to use
         the fitted tracks is to get their :py:attr:`measurements_list`::
@@ -66,49 +397,57 @@ class FitManager(object):
             >>> for track_y_hits in kfilters.measurements_list:
             ...     # do something with y hits of each track
 
+        :param event: optional event to fit, an :py:class:`event.EventHits`,
+         an :py:class:`eventio.EventView` or any iterable of ``(layer, strip,
+         count)`` records
         :returns: one Kalman filter object for each track that has been assigned
          to the hits in the detector
         :rtype: *list(TwoWayLKFilter)*
         """
-        layers = self.detector.get_layers(reverse=True)
+        self.fitters = []
+        layers = list(self.detector.get_layers())
+        records = self._records(event)
+        number = len(layers) - 1
         # special procedure for first layer
-        layer = next(layers)
-        self._new_filters(layer)
+        layer = layers[number]
+        positions, remaining, _ = self._candidates(layer, records[number])
+        self._new_filters(layer, positions, remaining,
+                          range(len(positions)))
 
         # Procedure for the remaining layers
-        for layer in layers:
+        for number in reversed(xrange(len(layers) - 1)):
+            layer = layers[number]
+            positions, remaining, scales = self._candidates(layer,
+                                                            records[number])
+            predictions, variances = [], []
             for fitter in self.fitters:
-                # TODO: investigate hungarian algorithm for assigning hits to
-                # filters
                 state, cov_matrix = fitter.state
-                predicted_y = state[0][0]
-                y_err = cov_matrix[0][0]
-                # find the strip that minimizes the distance to the predicted
-                # y position
-                if layer.hit_strips:  # if it's not empty
-                    strip = min(layer.hit_strips, key=
-                                lambda strip: abs(predicted_y - strip.pos()[1]))
-                    measured_y = strip.pos()[1]
-                else:
-                    measured_y = None
-                # allow for 3 sigma distance (remember y_err is variance)
-                if ((measured_y is None) or
-                        ((measured_y - predicted_y) ** 2 > 9 * y_err)):
+                predictions.append(state[0][0])
+                # remember the covariance holds variances
+                variances.append(cov_matrix[0][0])
+            if self.assignment == 'greedy':
+                choices = self._greedy(predictions, variances, positions,
+                                       remaining)
+            else:
+                choices = assign(predictions, variances, positions,
+                                 remaining, self.gate)
+            for fitter, candidate in zip(self.fitters, choices):
+                if candidate is None:
                     # step ignoring the measurement
                     fitter.step(add=True)
                     continue
-                else:
-                    measurement = Matrix([[measured_y]])
-                    fitter.step(measurement, add=True)
-                    # decrement the amount of hits in strip or remove strip
-                    # from hit_strips
-                    if strip.hits == 1:
-                        layer.hit_strips.remove(strip)
-                    else:
-                        strip.hits -= 1
+                measurement = Matrix([[positions[candidate]]])
+                if self.clustering:
+                    fitter.R = _scaled(self.filt.R, scales[candidate])
+                fitter.step(measurement, add=True)
+                fitter.R = self.filt.R
+                # use up one hit of the candidate
+                remaining[candidate] -= 1
             # now time to spawn new filters for measurements that have not been
             # assigned
-            self._new_filters(layer)
+            active = [candidate for candidate in xrange(len(positions))
+                      if remaining[candidate] > 0]
+            self._new_filters(layer, positions, remaining, active)
 
         # Selection based on amount of measurements
         self.fitters = [x for x in self.fitters if len(x.measurements) > 2]
@@ -130,6 +469,9 @@ class FitManager(object):
             ...     # work with coordinates, e.g. plot(x,y)
             ...
 
+        With clustering the stored measurements are revisited with the
+        unscaled measurement covariance of a single strip.
+
         :returns: list of filtered track coordinates
         :rtype: *list(list(tuple))*
         """
@@ -159,3 +501,123 @@ class FitManager(object):
 
             result.append(estimates)
         return result
+
+    def fit_packed(self, event=None):
+        """ Fit an event with :py:meth:`fit` and return the fitted tracks
+        packed into a :py:class:`FitResult`.
+
+        :rtype: FitResult"""
+        return FitResult.from_filters(self.fit(event),
+                                      self.filt.x.size()[0])
+
+    def fit_many(self, events, workers=None, chunksize=None):
+        """Fit many events, yielding one :py:class:`FitResult` per event in
+        the order of the events. The results are the same as those of
+        :py:meth:`fit_packed` on every event and do not depend on the number
+        of workers.
+
+        With more than one worker the events are fitted by a pool of
+        processes, each of which gets a copy of the manager once. Consecutive
+        events are fitted in chunks of about *chunksize* records, so that
+        chunks of events of very different sizes take about the same time,
+        and at most two chunks per worker are in flight at any time.
+
+        The workers map the records of an event file directly. Any other
+        events are streamed into a scratch file, chunk by chunk while the
+        first chunks are already being fitted. The workers append the packed
+        results to scratch files which the parent process maps, so only file
+        positions pass through the pipes of the pool.
+
+        Event files only record the regular geometry of a detector (see
+        :py:func:`eventio.geometry`), so they cannot be fitted with a
+        detector with variable strip edges or dead strips, whose match with
+        the file cannot be checked.
+
+        :param events: an :py:class:`eventio.EventReader`, the name of an
+         event file or an iterable of events (see :py:meth:`fit`)
+        :param int workers: number of processes, defaults to the number of
+         CPUs. With one worker no processes are started.
+        :param int chunksize: number of records fitted by one task, defaults
+         to a quarter of the share of every worker for event files
+        :return: generator of :py:class:`FitResult`
+        :raises ValueError: if the event file was recorded with a different
+         detector, or the detector is not regular
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if isinstance(events, (basestring, EventReader)):
+            if any(layer.edges is not None or layer.dead
+                   for layer in self.detector.get_layers()):
+                raise ValueError("Event files cannot be checked against a "
+                                 "detector with strip edges or dead strips")
+            if isinstance(events, basestring):
+                reader = EventReader(events)
+            else:
+                reader = events
+            try:
+                if reader.geometry != geometry(self.detector):
+                    raise ValueError("Geometry does not match the detector")
+                if workers <= 1:
+                    for event in reader:
+                        yield self.fit_packed(event)
+                    return
+                sizes = [len(event) for event in reader]
+                if chunksize is None:
+                    chunksize = sum(sizes) // (4 * workers)
+                tasks = [(reader.path, [(reader.starts[number],
+                                         reader.stops[number])
+                                        for number in xrange(start, stop)])
+                         for start, stop in _chunks(sizes, chunksize)]
+            finally:
+                if reader is not events:
+                    reader.close()
+            for result in self._fit_tasks(iter(tasks), workers):
+                yield result
+            return
+        if workers <= 1:
+            for event in events:
+                yield self.fit_packed(event)
+            return
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'events')
+            with open(path, 'wb') as spool:
+                tasks = ((path, ranges) for ranges in _stream(
+                    events, spool, chunksize or _CHUNK_RECORDS))
+                for result in self._fit_tasks(tasks, workers, directory):
+                    yield result
+        finally:
+            shutil.rmtree(directory)
+
+    def _fit_tasks(self, tasks, workers, directory=None):
+        """ Fit the chunks of events described by *tasks* in a pool of
+        processes, yielding the results in order. """
+        if directory is None:
+            directory = tempfile.mkdtemp()
+            try:
+                for result in self._fit_tasks(tasks, workers, directory):
+                    yield result
+            finally:
+                shutil.rmtree(directory)
+            return
+        # the workers need the manager, but not the filters of a fit
+        manager = copy(self)
+        manager.fitters = []
+        pool = multiprocessing.Pool(workers, _init_worker,
+                                    (manager, directory))
+        maps = {}
+        pending = collections.deque()
+        try:
+            for task in tasks:
+                pending.append(pool.apply_async(_fit_chunk, (task,)))
+                if len(pending) >= 2 * workers:
+                    for result in _unpack(maps, pending.popleft().get()):
+                        yield result
+            while pending:
+                for result in _unpack(maps, pending.popleft().get()):
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
+            for buf in maps.values():
+                buf.close()
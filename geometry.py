@@ -0,0 +1,201 @@
+"""
+Compiled detector geometry. A :py:class:`Geometry` holds everything needed to
+rebuild a :py:class:`detector.LayeredDetector` in flat arrays, with the layers
+sorted by their *x* position: the construction parameters of every layer, the
+strip pitch and the edges of all strips. It can be saved to a binary cache
+file, which is memory mapped when loaded, so that worker processes start with
+an identical detector without recomputing it::
+
+    >>> Geometry.from_detector(detector).save('detector.jkgm')
+    >>> # in every worker
+    >>> detector = LayeredDetector.from_geometry(Geometry.load('detector.jkgm'))
+
+The cache file starts with a 48 byte header (magic ``JKGM``, format version,
+position of the detector, number of layers, number of strip edges and number
+of dead strips) followed by the arrays *x*, *y*, *height*, *num_strips*,
+*edges*, *uniform*, *dead_layers* and *dead_strips*. All numbers are
+little-endian.
+"""
+# pylint: disable=C0103,R0913
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b'JKGM'
+VERSION = 2
+_HEADER = struct.Struct('<4sHH2dqqq')
+
+
+def _to_bytes(values):
+    """ Return an array as little-endian bytes. """
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tostring()
+
+
+def _from_bytes(typecode, data):
+    """ Return an array from little-endian bytes. """
+    values = array(typecode)
+    values.fromstring(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class Geometry(object):
+
+    """The geometry of a layered detector as parallel arrays, one entry per
+    layer in order of rising *x*. The edges of the strips of all layers are
+    stored in a single array, layer *i* owning the ``num_strips[i] + 1``
+    values starting at ``edge_offsets[i]`` (see :py:meth:`edges`). Dead
+    strips are listed as pairs of layer numbers and strip indices.
+
+    :param float x: horizontal position of the detector
+    :param float y: vertical position of the detector
+    :param x_layers: horizontal positions of the layers
+    :param y_layers: vertical positions (centres) of the layers
+    :param height: heights of the layers
+    :param num_strips: numbers of strips of the layers
+    :param strip_edges: edges of the strips of all layers, computed from the
+     other parameters if not given
+    :param uniform: flags telling which layers have strips of equal height,
+     all of them by default
+    :param dead_layers: layer numbers of the dead strips
+    :param dead_strips: indices of the dead strips in their layers
+    :var array pitch: strip height of every layer
+    :var array bottom: lower edge of every layer
+    :var array edge_offsets: position of the first edge of every layer in
+     :py:attr:`strip_edges`
+    """
+
+    def __init__(self, x, y, x_layers, y_layers, height, num_strips,
+                 strip_edges=None, uniform=None, dead_layers=(),
+                 dead_strips=()):
+        self.x = x
+        self.y = y
+        self.x_layers = array('d', x_layers)
+        self.y_layers = array('d', y_layers)
+        self.height = array('d', height)
+        self.num_strips = array('i', num_strips)
+        # same arithmetic as detector.Layer, so the layers can be rebuilt
+        # exactly
+        self.bottom = array('d', [y_layer - h * 0.5 for y_layer, h in
+                                  zip(self.y_layers, self.height)])
+        self.pitch = array('d', [((bottom + h) - bottom) / n for bottom, h, n
+                                 in zip(self.bottom, self.height,
+                                        self.num_strips)])
+        self.edge_offsets = array('l', [0])
+        for n in self.num_strips:
+            self.edge_offsets.append(self.edge_offsets[-1] + n + 1)
+        if strip_edges is None:
+            strip_edges = array('d')
+            for bottom, step, n in zip(self.bottom, self.pitch,
+                                       self.num_strips):
+                strip_edges.extend([bottom + i * step for i in xrange(n + 1)])
+        self.strip_edges = array('d', strip_edges)
+        if len(self.strip_edges) != self.edge_offsets[-1]:
+            raise ValueError("Wrong number of strip edges")
+        if uniform is None:
+            uniform = [1] * len(self.x_layers)
+        self.uniform = array('b', uniform)
+        self.dead_layers = array('i', dead_layers)
+        self.dead_strips = array('i', dead_strips)
+        # dead strips grouped by layer, for dead()
+        self._dead = {}
+        for layer, strip in zip(self.dead_layers, self.dead_strips):
+            self._dead.setdefault(layer, []).append(strip)
+
+    def __len__(self):
+        return len(self.x_layers)
+
+    def __eq__(self, other):
+        return (isinstance(other, Geometry) and
+                (self.x, self.y, self.x_layers, self.y_layers, self.height,
+                 self.num_strips, self.strip_edges, self.uniform,
+                 self.dead_layers, self.dead_strips) ==
+                (other.x, other.y, other.x_layers, other.y_layers,
+                 other.height, other.num_strips, other.strip_edges,
+                 other.uniform, other.dead_layers, other.dead_strips))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def edges(self, number):
+        """ Return the strip edges of layer *number*, from the bottom.
+
+        :rtype: array"""
+        return self.strip_edges[self.edge_offsets[number]:
+                                self.edge_offsets[number + 1]]
+
+    def dead(self, number):
+        """ Return the indices of the dead strips of layer *number*.
+
+        :rtype: list(int)"""
+        return list(self._dead.get(number, ()))
+
+    @classmethod
+    def from_detector(cls, detector):
+        """ Compile the geometry of a :py:class:`detector.LayeredDetector`.
+
+        :rtype: Geometry"""
+        layers = list(detector.get_layers())
+        strip_edges = array('d')
+        for layer in layers:
+            strip_edges.extend(layer.strip_edges())
+        dead = [(number, strip) for number, layer in enumerate(layers)
+                for strip in sorted(layer.dead)]
+        return cls(detector.x, detector.y,
+                   [layer.x for layer in layers],
+                   [layer.y for layer in layers],
+                   [layer.height for layer in layers],
+                   [layer.num_strips for layer in layers],
+                   strip_edges,
+                   [int(layer.edges is None) for layer in layers],
+                   [number for number, _ in dead],
+                   [strip for _, strip in dead])
+
+    def save(self, path):
+        """ Write the geometry to a binary cache file.
+
+        :param str path: file name
+        """
+        with open(path, 'wb') as cache:
+            cache.write(_HEADER.pack(MAGIC, VERSION, 0, self.x, self.y,
+                                     len(self), len(self.strip_edges),
+                                     len(self.dead_strips)))
+            for values in (self.x_layers, self.y_layers, self.height,
+                           self.num_strips, self.strip_edges, self.uniform,
+                           self.dead_layers, self.dead_strips):
+                cache.write(_to_bytes(values))
+
+    @classmethod
+    def load(cls, path):
+        """ Read a geometry from a binary cache file written by :py:meth:`save`.
+
+        :param str path: file name
+        :rtype: Geometry
+        """
+        with open(path, 'rb') as cache:
+            data = mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                (magic, version, _, x, y, n, num_edges,
+                 num_dead) = _HEADER.unpack_from(data, 0)
+                if magic != MAGIC:
+                    raise IOError("Not a geometry file: {}".format(path))
+                if version != VERSION:
+                    raise IOError(
+                        "Unsupported geometry file version {}".format(version))
+                columns = []
+                offset = _HEADER.size
+                for typecode, length in (('d', n), ('d', n), ('d', n),
+                                         ('i', n), ('d', num_edges), ('b', n),
+                                         ('i', num_dead), ('i', num_dead)):
+                    size = array(typecode).itemsize * length
+                    columns.append(_from_bytes(typecode,
+                                               data[offset:offset + size]))
+                    offset += size
+            finally:
+                data.close()
+        return cls(x, y, *columns)
@@ -0,0 +1,147 @@
+"""
+Sorted index of hit positions in a layer (of fired strips, clusters or any
+other candidates), answering window and nearest neighbour queries by binary
+search instead of scanning all hits. It knows nothing about detectors, so it
+is shared by :py:mod:`fitter` and :py:mod:`assignment`.
+"""
+# pylint: disable=C0103
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+def _find(links, k):
+    """ Follow the skip links from *k* to the first live entry, pointing
+    every visited link straight at it. """
+    root = k
+    while links[root] != root:
+        root = links[root]
+    while links[k] != root:
+        links[k], k = root, links[k]
+    return root
+
+
+class HitIndex(object):
+
+    """Sorted index of hit positions. Queries return the indices the hits
+    had in the sequence the index was built from::
+
+        >>> index = HitIndex(positions, counts)
+        >>> index.query(predicted_y, 3 * sigma)
+        [4, 0]
+        >>> index.nearest(predicted_y)
+        4
+        >>> index.use(4)
+
+    Every hit can be used a limited number of times (:py:meth:`use`), after
+    which :py:meth:`nearest` skips it. Used up hits are unlinked from the
+    sorted order, so a nearest neighbour query costs one binary search plus
+    an amortized almost constant number of steps, however many hits are used
+    up.
+
+    :param positions: **y** position of every hit
+    :type positions: list(float)
+    :param counts: number of times every hit can be used, once by default
+    :type counts: list(int)
+    :var array positions: the positions in rising order
+    :var array order: original index of every sorted position
+    :var array remaining: number of remaining uses of every hit, by original
+     index
+    """
+
+    def __init__(self, positions, counts=None):
+        n = len(positions)
+        self.order = array('i', sorted(xrange(n), key=positions.__getitem__))
+        self.positions = array('d', [positions[i] for i in self.order])
+        self.remaining = array('i', [1] * n if counts is None else counts)
+        self._rank = array('i', [0]) * n
+        for k, hit in enumerate(self.order):
+            self._rank[hit] = k
+        # next live sorted entry at or above k (n if none), and at or below
+        # k - 1 shifted by one (0 if none)
+        self._above = array('i', xrange(n + 1))
+        self._below = array('i', xrange(n + 1))
+        for hit in xrange(n):
+            if self.remaining[hit] <= 0:
+                self._unlink(hit)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _unlink(self, hit):
+        """ Remove a used up hit from the sorted order. """
+        k = self._rank[hit]
+        self._above[k] = k + 1
+        self._below[k + 1] = k
+
+    def window(self, low, high):
+        """ Return the hits from *low* to *high* (inclusive), in order of
+        their positions. Used up hits are included.
+
+        :rtype: list(int)"""
+        order = self.order
+        return [order[k] for k in xrange(bisect_left(self.positions, low),
+                                         bisect_right(self.positions, high))]
+
+    def query(self, y, reach):
+        """ Return the hits at most *reach* away from *y*, e.g. inside a
+        window of a few standard deviations around a predicted position.
+
+        :rtype: list(int)"""
+        return self.window(y - reach, y + reach)
+
+    def nearest(self, y):
+        """Return the hit nearest to *y* which is not used up, or ``None`` if
+        there is none. Of several hits at the same distance the one with the
+        lowest original index is returned.
+
+        :rtype: int
+        """
+        positions, order = self.positions, self.order
+        n = len(positions)
+        split = bisect_left(positions, y)
+        # sorting is stable, so among equal positions the first live entry
+        # has the lowest original index
+        right = _find(self._above, split)
+        left = _find(self._below, split) - 1
+        if left >= 0:
+            left = _find(self._above, bisect_left(positions, positions[left]))
+        if left < 0:
+            return order[right] if right < n else None
+        if right >= n:
+            return order[left]
+        below, above = y - positions[left], positions[right] - y
+        if below < above or (below == above and order[left] < order[right]):
+            return order[left]
+        return order[right]
+
+    def use(self, hit):
+        """ Use one of the remaining uses of *hit*. """
+        self.remaining[hit] -= 1
+        if self.remaining[hit] == 0:
+            self._unlink(hit)
+
+    def match(self, lows, highs):
+        """Answer many window queries in one sort-merge pass: the windows are
+        sorted by their lower ends and the hits are scanned from a pointer
+        that only moves forward.
+
+        :param lows: lower end of every window
+        :param highs: upper end of every window
+        :return: the hits inside every window
+        :rtype: list(list(int))
+        """
+        positions, order = self.positions, self.order
+        n = len(positions)
+        result = [None] * len(lows)
+        start = 0
+        for query in sorted(xrange(len(lows)), key=lows.__getitem__):
+            low, high = lows[query], highs[query]
+            while start < n and positions[start] < low:
+                start += 1
+            found = []
+            k = start
+            while k < n and positions[k] <= high:
+                found.append(order[k])
+                k += 1
+            result[query] = found
+        return result
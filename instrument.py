@@ -0,0 +1,193 @@
+"""
+Opt-in instrumentation of the hot paths of :py:mod:`kfilter` and
+:py:mod:`matrix`. When enabled, every call to an instrumented method is
+counted and timed (the timers are cumulative and inclusive, so the time spent
+in :py:meth:`kfilter.LKFilter.step` also contains the time of the
+:py:class:`matrix.Matrix` operations it performs). Matrix operations
+additionally keep a histogram of the shapes of their operands.
+
+Instrumentation is disabled by default. Nothing is installed until
+:py:func:`enable` is called and :py:func:`disable` puts the original methods
+back, so a disabled instrumentation has no cost at all::
+
+    >>> import instrument
+    >>> instrument.enable()
+    >>> for measurement in measurements:
+    ...     filt.step(measurement)
+    ...
+    >>> instrument.disable()
+    >>> stats = instrument.snapshot()
+    >>> stats['LKFilter.step']['calls']
+    100
+    >>> instrument.to_json('stats.json', release='1.0')
+
+Additional methods (e.g. of user defined filters) can be instrumented with
+:py:func:`register`.
+"""
+# pylint: disable=C0103,W0603
+import functools
+import json
+from timeit import default_timer as _clock
+
+# name -> [number of calls, cumulative time]
+_RECORDS = {}
+# name -> {shape: number of calls}
+_SHAPES = {}
+# registered hooks: (class, attribute, name, shape function)
+_HOOKS = []
+# (class, attribute) -> original function, only filled while enabled
+_ORIGINALS = {}
+_enabled = False
+
+
+def _unary_shape(self, *_):
+    """ Return the shape of the matrix an operation is performed on. """
+    return "{}x{}".format(*self.size())
+
+
+def _binary_shape(self, other, *_):
+    """ Return the shapes of both operands of a matrix operation. """
+    return "{}x{},{}x{}".format(*(self.size() + other.size()))
+
+
+def _default_hooks():
+    """ Register the hot paths of :py:mod:`kfilter` and :py:mod:`matrix`.
+    Registering twice is harmless. """
+    from matrix import Matrix
+    from kfilter import LKFilter, TwoWayLKFilter
+    register(LKFilter, 'update', 'LKFilter.update')
+    register(LKFilter, 'predict', 'LKFilter.predict')
+    register(LKFilter, 'step', 'LKFilter.step')
+    register(TwoWayLKFilter, 'reverse', 'TwoWayLKFilter.reverse')
+    register(Matrix, '__mul__', 'Matrix.mul', _binary_shape)
+    register(Matrix, '__add__', 'Matrix.add', _binary_shape)
+    register(Matrix, '__sub__', 'Matrix.sub', _binary_shape)
+    register(Matrix, 'LU', 'Matrix.LU', _unary_shape)
+    register(Matrix, '_inverse', 'Matrix.inverse', _unary_shape)
+
+
+def _wrap(func, name, shape):
+    """ Return a version of *func* that records its calls under *name*. The
+    instrumentation never changes what *func* returns or raises: calls whose
+    shape cannot be determined are counted and timed, but left out of the
+    shape histogram. """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        """ Instrumented method. """
+        key = None
+        if shape is not None:
+            try:
+                key = shape(*args)
+            except Exception:  # pylint: disable=W0703
+                key = None
+        start = _clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = _clock() - start
+            record = _RECORDS.setdefault(name, [0, 0.0])
+            record[0] += 1
+            record[1] += elapsed
+            if key is not None:
+                histogram = _SHAPES.setdefault(name, {})
+                histogram[key] = histogram.get(key, 0) + 1
+    return wrapper
+
+
+def _install(cls, attr, name, shape):
+    """ Replace ``cls.attr`` by its instrumented version. """
+    original = cls.__dict__[attr]
+    _ORIGINALS[(cls, attr)] = original
+    setattr(cls, attr, _wrap(original, name, shape))
+
+
+def register(cls, attr, name=None, shape=None):
+    """Register a method to be instrumented. The method has to be defined
+    directly in *cls* (not inherited). If instrumentation is currently enabled
+    the method is instrumented immediately.
+
+    :param type cls: class defining the method
+    :param str attr: name of the method
+    :param str name: name under which the method is reported, defaults to
+     ``"<class name>.<attr>"``
+    :param shape: optional function called with the arguments of the method
+     which returns a key for the shape histogram
+    """
+    if name is None:
+        name = "{}.{}".format(cls.__name__, attr)
+    if any(hook[:2] == (cls, attr) for hook in _HOOKS):
+        return
+    _HOOKS.append((cls, attr, name, shape))
+    if _enabled:
+        _install(cls, attr, name, shape)
+
+
+def enable():
+    """ Install the instrumentation wrappers on all registered methods. """
+    global _enabled
+    if _enabled:
+        return
+    _default_hooks()
+    for cls, attr, name, shape in _HOOKS:
+        _install(cls, attr, name, shape)
+    _enabled = True
+
+
+def disable():
+    """ Restore the original (uninstrumented) methods. Recorded statistics
+    are kept until :py:func:`reset` is called. """
+    global _enabled
+    for (cls, attr), original in _ORIGINALS.items():
+        setattr(cls, attr, original)
+    _ORIGINALS.clear()
+    _enabled = False
+
+
+def is_enabled():
+    """ Return ``True`` if instrumentation is currently enabled. """
+    return _enabled
+
+
+def reset():
+    """ Clear all recorded counters, timers and shape histograms. """
+    _RECORDS.clear()
+    _SHAPES.clear()
+
+
+def snapshot():
+    """Return a copy of the current statistics. The result is a dictionary
+    mapping names of instrumented methods to dictionaries with the keys
+    ``calls``, ``total`` (cumulative time in seconds), ``mean`` (time per call)
+    and, for matrix operations, ``shapes`` (calls per operand shape).
+
+    :rtype: *dict*
+    """
+    result = {}
+    for name, (calls, total) in _RECORDS.items():
+        entry = {'calls': calls, 'total': total, 'mean': total / calls}
+        if name in _SHAPES:
+            entry['shapes'] = dict(_SHAPES[name])
+        result[name] = entry
+    return result
+
+
+def to_json(dest=None, **meta):
+    """Export the current :py:func:`snapshot` as JSON. Additional keyword
+    arguments (e.g. release or host name) are stored in the ``meta`` field so
+    that exports from different releases and deployments can be compared.
+
+    :param dest: file name or file object to write to, if ``None`` only the
+     JSON string is returned
+    :return: the JSON document
+    :rtype: *str*
+    """
+    document = json.dumps({'meta': meta, 'stats': snapshot()},
+                          indent=2, sort_keys=True)
+    if dest is None:
+        return document
+    if hasattr(dest, 'write'):
+        dest.write(document)
+    else:
+        with open(dest, 'w') as out:
+            out.write(document)
+    return document
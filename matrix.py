@@ -4,6 +4,7 @@ Based on:
 https://github.com/ozzloy/udacity-cs373/blob/master/unit-2.py
 """
 # pylint: disable=W0141,C0103
+from array import array
 
 
 class Matrix(object):
@@ -118,6 +119,16 @@ class Matrix(object):
             self.value[i][i] = 1
         return self
 
+    @classmethod
+    def unpack(cls, data, dimx, dimy):
+        """ Return a *dimx* x *dimy* matrix from the flat row-major sequence
+        *data* (e.g. an ``array`` created by :py:meth:`pack`). The entries are
+        converted to Python floats. """
+        if dimx < 1 or dimy < 1 or len(data) != dimx * dimy:
+            raise ValueError("Invalid size of matrix")
+        return cls([[float(entry) for entry in data[i * dimy:(i + 1) * dimy]]
+                    for i in range(dimx)])
+
     ####################### Helper methods  ############################
     def show(self):
         """ Print the matrix. """
@@ -153,6 +164,17 @@ class Matrix(object):
         """
         return (self.dimx, self.dimy)
 
+    def pack(self, typecode='d'):
+        """
+        Return the entries of the matrix in row-major order as a compact
+        ``array``. With ``typecode='f'`` the entries are stored in single
+        precision (4 bytes each) and rounded to about 7 significant digits.
+
+        :param str typecode: ``array`` type code, ``'d'`` or ``'f'``
+        :rtype: *array*
+        """
+        return array(typecode, [entry for row in self._value for entry in row])
+
     def __getitem__(self, k):
         """ Return row of matrix. """
         return self.value[k]
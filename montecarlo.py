@@ -0,0 +1,120 @@
+"""
+Bulk Monte Carlo generation of events. Every event gets its own random
+number generator, seeded from a master seed and the number of the event, so
+an event depends on nothing but these two numbers. Events can therefore be
+generated in any order and spread over any number of processes while the
+output stays bit-identical::
+
+    >>> detector = LayeredDetector(1, 0, 1.0, 8, 15, 25)
+    >>> for hits in generate_events(detector, 1000, seed=42, workers=4):
+    ...     fitter.fit(hits)
+    ...
+    >>> write_events('sample.jkev', detector, 10 ** 6, seed=42, workers=8)
+"""
+# pylint: disable=C0103,R0913
+import hashlib
+import multiprocessing
+import random
+import struct
+from track import gen_straight_tracks
+from eventio import EventWriter
+
+# parameters of the generation in worker processes, set by _init_worker
+_WORKER = {}
+
+
+def event_seed(seed, number):
+    """ Return the seed of the random number generator of event *number*,
+    derived from the master *seed* with a cryptographic hash so that the
+    streams of different events are independent.
+
+    :rtype: int"""
+    digest = hashlib.sha256("{}:{}".format(seed, number)).digest()
+    return struct.unpack('<Q', digest[:8])[0]
+
+
+def generate_event(detector, seed, number, tracks_per_event=10,
+                   track_ids=False):
+    """Generate event *number* of the sample with the master *seed*: draw
+    straight tracks (:py:func:`track.gen_straight_tracks`) and propagate them
+    through the detector with :py:meth:`detector.LayeredDetector.simulate`,
+    which does not modify the detector.
+
+    :param detector: detector in which the event is recorded
+    :type detector: LayeredDetector
+    :param tracks_per_event: number of tracks, or a function returning the
+     number of tracks given the random number generator of the event
+    :param bool track_ids: toggle recording of the true track ids
+    :rtype: EventHits
+    """
+    rng = random.Random(event_seed(seed, number))
+    if callable(tracks_per_event):
+        tracks_per_event = tracks_per_event(rng)
+    tracks = gen_straight_tracks(tracks_per_event, rng)
+    return detector.simulate(tracks, track_ids)
+
+
+def _generate(detector, seed, tracks_per_event, track_ids, start, stop):
+    """ Generate the events with numbers from *start* to *stop*. """
+    return [generate_event(detector, seed, number, tracks_per_event,
+                           track_ids) for number in xrange(start, stop)]
+
+
+def _init_worker(*args):
+    """ Store the generation parameters in a worker process. """
+    _WORKER['args'] = args
+
+
+def _generate_chunk(bounds):
+    """ Generate a chunk of events in a worker process. """
+    return _generate(*(_WORKER['args'] + bounds))
+
+
+def generate_events(detector, n_events, seed, tracks_per_event=10, workers=1,
+                    chunksize=64, track_ids=False):
+    """Generate a sample of events, yielding them lazily in order of their
+    numbers. With more than one worker the events are generated in chunks of
+    *chunksize* events by a pool of processes. The events do not depend on
+    the number of workers or the chunk size.
+
+    :param detector: detector in which the events are recorded
+    :type detector: LayeredDetector
+    :param int n_events: number of events
+    :param int seed: master seed of the sample
+    :param tracks_per_event: see :py:func:`generate_event`, a function has to
+     be picklable (defined at module level) if *workers* is larger than one
+    :param int workers: number of processes
+    :param int chunksize: number of events generated by one task
+    :param bool track_ids: toggle recording of the true track ids
+    :return: generator of :py:class:`event.EventHits`
+    """
+    params = (detector, seed, tracks_per_event, track_ids)
+    chunks = [(start, min(start + chunksize, n_events))
+              for start in xrange(0, n_events, chunksize)]
+    if workers <= 1:
+        for start, stop in chunks:
+            for hits in _generate(*(params + (start, stop))):
+                yield hits
+        return
+    pool = multiprocessing.Pool(workers, _init_worker, params)
+    try:
+        for events in pool.imap(_generate_chunk, chunks):
+            for hits in events:
+                yield hits
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def write_events(path, detector, n_events, seed, **kwargs):
+    """Generate a sample of events (see :py:func:`generate_events`, which
+    receives the keyword arguments) and append it to an event file.
+
+    :param str path: file name
+    :return: number of events in the file
+    :rtype: int
+    """
+    with EventWriter(path, detector) as writer:
+        for hits in generate_events(detector, n_events, seed, **kwargs):
+            writer.write(hits)
+        return len(writer)
@@ -0,0 +1,160 @@
+"""
+Parallel-in-time Kalman filtering. Filtering a sequence is a prefix scan
+with an associative operator (S. Sarkka and A. F. Garcia-Fernandez,
+*Temporal Parallelization of Bayesian Smoothers*, IEEE TAC 2021): every
+measurement is turned into an element :math:`(A, b, C, \\eta, J)` and
+combining the elements of the first *k* measurements with :py:func:`combine`
+gives the filtered estimate at measurement *k* (:math:`b` and :math:`C`).
+
+:py:func:`parallel_filter` splits the sequence into chunks and scans it in
+three passes:
+
+1. the elements of every chunk are combined in parallel (one process per
+   chunk),
+2. the chunk results are combined sequentially, giving the exact filter
+   state at the start of every chunk,
+3. every chunk is filtered in parallel, starting from that state.
+
+The wall time of long sequences therefore scales with the number of
+processes::
+
+    >>> filt = LKFilter(A, H, x, P, Q, R)
+    >>> states = parallel_filter(filt, measurements, workers=8)
+    >>> # same as [filt.step(measurement) for measurement in measurements]
+"""
+# pylint: disable=C0103,R0913,R0914
+import multiprocessing
+from matrix import Matrix
+from kfilter import LKFilter
+
+
+def combine(first, second):
+    """Return the combination of two filtering elements, each given as a tuple
+    :math:`(A, b, C, \\eta, J)` of matrices. *first* has to precede *second*
+    in time. The operator is associative, but not commutative.
+
+    :rtype: *tuple(Matrix)*
+    """
+    A1, b1, C1, eta1, J1 = first
+    A2, b2, C2, eta2, J2 = second
+    I = Matrix.identity(A1.size()[0])
+    A2M = A2 * (I + C1 * J2).I
+    A1tN = A1.T * (I + J2 * C1).I
+    return (A2M * A1,
+            A2M * (b1 + C1 * eta2) + b2,
+            A2M * C1 * A2.T + C2,
+            A1tN * (eta2 - J2 * b1) + eta1,
+            A1tN * J2 * A1 + J1)
+
+
+class _Elements(object):
+
+    """ Factory of the filtering elements of a model. The parts which do not
+    depend on the measurement are computed once. """
+
+    def __init__(self, A, H, Q, R):
+        self.A, self.H, self.Q, self.R = A, H, Q, R
+        n = A.size()[0]
+        self.zero = Matrix.zero(n, n)
+        self.zero_vector = Matrix.zero(n, 1)
+        S_inv = (H * Q * H.T + R).I
+        K = Q * H.T * S_inv
+        IKH = Matrix.identity(n) - K * H
+        self.K = K
+        self.measured = (IKH * A, IKH * Q)
+        self.AtHtS_inv = A.T * H.T * S_inv
+        self.J = self.AtHtS_inv * H * A
+
+    def first(self, x, P, measurement):
+        """ Return the element of the first measurement, with prior (x, P). """
+        if measurement is not None:
+            filt = LKFilter(self.A, self.H, x, P, self.Q, self.R)
+            filt.update(measurement)
+            x, P = filt.state
+        return (self.zero, x, P, self.zero_vector, self.zero)
+
+    def __call__(self, measurement):
+        """ Return the element of any later measurement. """
+        if measurement is None:
+            return (self.A, self.zero_vector, self.Q, self.zero_vector,
+                    self.zero)
+        A, C = self.measured
+        return (A, self.K * measurement, C, self.AtHtS_inv * measurement,
+                self.J)
+
+
+def _chunk_total(args):
+    """ Combine all elements of a chunk. The first chunk contains the prior. """
+    model, prior, measurements = args
+    elements = _Elements(*model)
+    if prior is not None:
+        total = elements.first(prior[0], prior[1], measurements[0])
+    else:
+        total = elements(measurements[0])
+    for measurement in measurements[1:]:
+        total = combine(total, elements(measurement))
+    return total
+
+
+def _chunk_filter(args):
+    """ Run the sequential filter over a chunk starting from a known state. """
+    model, (x, P), measurements = args
+    A, H, Q, R = model
+    filt = LKFilter(A, H, x, P, Q, R)
+    return [filt.step(measurement) for measurement in measurements]
+
+
+def parallel_filter(filt, measurements, workers=None, chunks=None):
+    """Filter a whole sequence of measurements in parallel. The result is
+    the list of states returned by :py:meth:`kfilter.LKFilter.step` when
+    stepping *filt* over the measurements (the state predicted for the next
+    measurement after each update), equal to the sequential result up to
+    rounding. *filt* itself is not modified.
+
+    :param LKFilter filt: filter providing the model (**A**, **H**, **Q**,
+     **R**) and the initial state
+    :param measurements: measurements, ``None`` entries mark missing ones
+    :type measurements: list(Matrix)
+    :param int workers: number of processes, defaults to the number of CPUs.
+     With one worker no processes are started.
+    :param int chunks: number of chunks the sequence is split into, defaults
+     to the number of workers
+    :return: filter states after every measurement
+    :rtype: *list(tuple(Matrix))*
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if chunks is None:
+        chunks = workers
+    N = len(measurements)
+    if N == 0:
+        return []
+    chunks = max(1, min(chunks, N))
+    size = -(-N // chunks)
+    parts = [measurements[i:i + size] for i in xrange(0, N, size)]
+    model = (filt.A, filt.H, filt.Q, filt.R)
+    A, _, Q, _ = model
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    mapper = pool.map if pool is not None else map
+    try:
+        # 1. combine the elements of every chunk (the last one is not needed)
+        jobs = [(model, filt.state if i == 0 else None, part)
+                for i, part in enumerate(parts[:-1])]
+        totals = mapper(_chunk_total, jobs)
+        # 2. sequential scan over the chunk totals, giving the filter state
+        # at the start of each chunk
+        starts = [filt.state]
+        carry = None
+        for total in totals:
+            carry = total if carry is None else combine(carry, total)
+            _, b, C, _, _ = carry
+            starts.append((A * b, A * C * A.T + Q))
+        # 3. filter the chunks from their starting states
+        jobs = [(model, start, part) for start, part in zip(starts, parts)]
+        results = mapper(_chunk_filter, jobs)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return [state for part in results for state in part]
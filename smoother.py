@@ -0,0 +1,96 @@
+"""
+Offline smoothing of a whole sequence of measurements. When all
+measurements are known in advance, the smoothed state estimates are the
+solution of one linear least-squares problem. Its normal equations are
+block-tridiagonal (every state is only coupled to its neighbours), so they
+are solved directly in a single forward and backward pass over the sequence
+(a block Thomas algorithm), instead of stepping a
+:py:class:`kfilter.TwoWayLKFilter` back and forth.
+
+The model is the one used by :py:class:`kfilter.LKFilter`: the state
+**x** is propagated with ``x_next = A x + w``, measured with ``z = H x + v``
+(with **w** and **v** having the covariances **Q** and **R**) and the initial
+estimate (**x**, **P**) is the estimate of the state at the first
+measurement::
+
+    >>> states, covariances = batch_smooth(A, H, Q, R, x, P, measurements)
+    >>> positions = [state[0][0] for state in states]
+"""
+# pylint: disable=C0103,R0913,R0914
+
+
+def batch_smooth(A, H, Q, R, x, P, measurements):
+    """Return the smoothed state estimates and their marginal covariances for
+    every measurement of the sequence. These are the fixed-interval
+    (Rauch-Tung-Striebel) smoothed estimates: every estimate uses all
+    measurements, both before and after it. The estimate at the last
+    measurement equals the one of the forward filter after its update.
+
+    The normal equations of the problem have the diagonal blocks
+
+    .. math::
+        D_k = H^T R^{-1} H + Q^{-1} + A^T Q^{-1} A
+
+    (with :math:`P^{-1}` replacing :math:`Q^{-1}` for the first state and no
+    :math:`A^T Q^{-1} A` term for the last one) and off-diagonal blocks
+    :math:`-Q^{-1} A`. The process covariance **Q** therefore has to be
+    invertible.
+
+    :param Matrix A: state transition matrix
+    :param Matrix H: observation matrix
+    :param Matrix Q: process covariance
+    :param Matrix R: measurement covariance
+    :param Matrix x: initial estimate of the state
+    :param Matrix P: initial estimate of the state covariance
+    :param measurements: measurements (column matrices), ``None`` entries
+     mark missing measurements
+    :type measurements: list(Matrix)
+    :return: smoothed states and their covariances
+    :rtype: *tuple(list(Matrix))*
+    """
+    N = len(measurements)
+    if N == 0:
+        return [], []
+    Q_inv = Q.I
+    HtR_inv = H.T * R.I
+    HtR_invH = HtR_inv * H
+    AtQ_inv = A.T * Q_inv
+    AtQ_invA = AtQ_inv * A
+    Q_invA = AtQ_inv.T
+
+    # Forward elimination: C_k is the diagonal block after eliminating the
+    # previous state, C_inv its inverse and y_k the eliminated right side.
+    C_inv = [None] * N
+    y = [None] * N
+    P_inv = P.I
+    for k, measurement in enumerate(measurements):
+        if k == 0:
+            D = P_inv
+            b = P_inv * x
+        else:
+            D = Q_inv
+            b = None
+        if measurement is not None:
+            D = D + HtR_invH
+            b = HtR_inv * measurement if b is None else (
+                b + HtR_inv * measurement)
+        if k < N - 1:
+            D = D + AtQ_invA
+        if k > 0:
+            G = Q_invA * C_inv[k - 1]
+            D = D - G * AtQ_inv
+            coupling = G * y[k - 1]
+            b = coupling if b is None else b + coupling
+        C_inv[k] = D.I
+        y[k] = b
+
+    # Back substitution, covariances from the block-tridiagonal inverse.
+    states = [None] * N
+    covariances = [None] * N
+    states[-1] = C_inv[-1] * y[-1]
+    covariances[-1] = C_inv[-1]
+    for k in reversed(xrange(N - 1)):
+        G = C_inv[k] * AtQ_inv
+        states[k] = C_inv[k] * y[k] + G * states[k + 1]
+        covariances[k] = C_inv[k] + G * covariances[k + 1] * G.T
+    return states, covariances
@@ -0,0 +1,70 @@
+""" Assignment module unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..assignment import assign, hungarian, gated_costs
+import itertools
+import random
+import unittest
+
+
+def total_cost(choices, predictions, variances, positions, gate=9.0):
+    cost = 0.0
+    for track, candidate in enumerate(choices):
+        if candidate is None:
+            cost += gate
+        else:
+            cost += ((positions[candidate] - predictions[track]) ** 2 /
+                     variances[track])
+    return cost
+
+
+class TestAssignment(unittest.TestCase):
+
+    def test_hungarian(self):
+        rng = random.Random(5)
+        for _ in xrange(20):
+            n = rng.randint(1, 5)
+            cost = [[rng.random() for _ in xrange(n)] for _ in xrange(n)]
+            best = min(sum(cost[i][p[i]] for i in xrange(n))
+                       for p in itertools.permutations(range(n)))
+            result = hungarian(cost)
+            self.assertEqual(sorted(result), range(n))
+            self.assertAlmostEqual(sum(cost[i][result[i]]
+                                       for i in xrange(n)), best)
+
+    def test_gate(self):
+        pairs = gated_costs([0.0, 1.0], [0.01, 0.0], [0.25, 0.31, 1.0, -0.2])
+        self.assertEqual(sorted((track, candidate) for track, candidate, _
+                                in pairs), [(0, 0), (0, 3), (1, 2)])
+
+    def test_optimal(self):
+        # greedy in order would give the first track the first hit
+        self.assertEqual(assign([0.15, 0.1], [0.01, 0.01], [0.14, 0.2],
+                                [1, 1]), [1, 0])
+        rng = random.Random(7)
+        for _ in xrange(100):
+            tracks, hits = rng.randint(1, 4), rng.randint(0, 3)
+            predictions = [rng.random() for _ in xrange(tracks)]
+            variances = [rng.uniform(0.001, 0.02) for _ in xrange(tracks)]
+            positions = [rng.random() for _ in xrange(hits)]
+            counts = [rng.randint(0, 2) for _ in xrange(hits)]
+            choices = assign(predictions, variances, positions, counts)
+            for candidate in xrange(hits):
+                self.assertTrue(choices.count(candidate) <= counts[candidate])
+            best = None
+            for option in itertools.product(*[[None] + range(hits)] * tracks):
+                if any(option.count(candidate) > counts[candidate]
+                       for candidate in xrange(hits)):
+                    continue
+                if any(candidate is not None and
+                       (positions[candidate] - predictions[track]) ** 2 >
+                       9 * variances[track]
+                       for track, candidate in enumerate(option)):
+                    continue
+                cost = total_cost(option, predictions, variances, positions)
+                best = cost if best is None else min(best, cost)
+            self.assertAlmostEqual(total_cost(choices, predictions, variances,
+                                              positions), best)
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestAssignment)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
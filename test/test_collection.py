@@ -0,0 +1,93 @@
+""" TrackCollection unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..track import (TrackCollection, LineTrack, MagneticTrack,
+                     gen_straight_tracks, TrackGenerator, Uniform, Normal,
+                     Constant)
+from ..detector import LayeredDetector
+import unittest
+
+
+class TestTrackCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.tracks = gen_straight_tracks(20) + [MagneticTrack(0.2, 0.1, 3.0),
+                                                 MagneticTrack(-0.1, 0.0, 5.0)]
+        self.collection = TrackCollection.from_tracks(self.tracks)
+
+    def test_columns(self):
+        self.assertEqual(len(self.collection), 22)
+        self.assertEqual(list(self.collection.kind), [0] * 20 + [1, 1])
+        track = self.collection[3]
+        self.assertTrue(isinstance(track, LineTrack))
+        self.assertEqual((track.a, track.b),
+                         (self.tracks[3].a, self.tracks[3].b))
+        self.assertTrue(isinstance(self.collection[-1], MagneticTrack))
+        self.assertEqual(len(self.collection[5:]), 17)
+        self.assertEqual(self.collection[20:].B.tolist(), [3.0, 5.0])
+        steep = self.collection.compress([track.a > 0 for track in
+                                          self.tracks])
+        self.assertTrue(all(a > 0 for a in steep.a))
+        self.assertRaises(ValueError, TrackCollection, *([1.0], []))
+        other = TrackCollection()
+        other.extend(self.collection[:20])
+        other.extend(self.tracks[20:])
+        self.assertEqual(other, self.collection)
+
+    def test_intercepts(self):
+        for x in [1.0, 2.5, 4.0]:
+            self.assertEqual(self.collection.get_yintercepts_at(x).tolist(),
+                             [track.get_yintercept(x)
+                              for track in self.tracks])
+        # a magnetic track needs a field
+        self.assertRaises(ValueError, MagneticTrack, 0.2, 0.1, 0.0)
+        broken = TrackCollection([0.2], [0.1], [0.0],
+                                 [TrackCollection.MAGNETIC])
+        self.assertRaises(ValueError, broken.get_yintercepts_at, 1.0)
+
+    def test_detector(self):
+        detector = LayeredDetector(1, 0, 1.0, 4, 5, 30)
+        self.assertEqual(detector.simulate(self.collection, track_ids=True),
+                         detector.simulate(self.tracks, track_ids=True))
+        detector.propagate_tracks(self.collection)
+        self.assertEqual(detector.event_hits(),
+                         detector.simulate(self.tracks))
+
+
+class TestTrackGenerator(unittest.TestCase):
+
+    def test_batches(self):
+        generator = TrackGenerator(seed=3, batch_size=40)
+        sizes = [len(batch) for batch in generator.batches(100)]
+        self.assertEqual(sizes, [40, 40, 20])
+        tracks = TrackGenerator(seed=3, batch_size=40).generate(100)
+        self.assertEqual(tracks[:40], TrackGenerator(seed=3).generate(40))
+        self.assertTrue(all(abs(a) <= 0.268 for a in tracks.a))
+        self.assertTrue(all(abs(b) <= 0.1 for b in tracks.b))
+        self.assertNotEqual(tracks, TrackGenerator(seed=4).generate(100))
+        endless = TrackGenerator(batch_size=5).batches()
+        self.assertEqual([len(next(endless)) for _ in xrange(3)], [5, 5, 5])
+
+    def test_distributions(self):
+        generator = TrackGenerator(angle=Constant(45.0), intercept=Normal(1, 0),
+                                   field=Constant(2.0), seed=1)
+        tracks = generator.generate(3)
+        self.assertEqual(list(tracks.kind), [TrackCollection.MAGNETIC] * 3)
+        for track in tracks:
+            self.assertTrue(isinstance(track, MagneticTrack))
+            self.assertAlmostEqual(track.a, 1.0)
+            self.assertEqual((track.b, track.B), (1.0, 2.0))
+
+    def test_zero_field(self):
+        generator = TrackGenerator(field=Uniform(-1, 1), seed=5,
+                                   min_field=0.5)
+        tracks = generator.generate(200)
+        self.assertTrue(all(abs(field) >= 0.5 for field in tracks.B))
+        self.assertEqual(len(tracks.get_yintercepts_at(1.0)), 200)
+        generator = TrackGenerator(field=Constant(0.0), seed=5)
+        self.assertRaises(ValueError, generator.generate, 10)
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestTrackCollection)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestTrackGenerator)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
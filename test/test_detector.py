@@ -0,0 +1,165 @@
+""" Detector module unit tests. """
+# pylint: disable=C0111,R0904,C0103,W0212
+from ..detector import LayeredDetector, Strip
+from ..track import LineTrack, MagneticTrack, gen_straight_tracks
+import unittest
+
+
+class TestLayer(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = LayeredDetector(1, 0, 1.0, 4, 5, 10)
+        self.layer = self.detector.layers[0]
+
+    def test_lazy_strips(self):
+        self.assertEqual(self.layer._strips, {})
+        self.assertEqual(len(self.layer.strips), 10)
+        strip = self.layer.strips[3]
+        self.assertTrue(isinstance(strip, Strip))
+        self.assertEqual(strip.pos(), self.layer.strip_pos(3))
+        self.assertAlmostEqual(strip.pos()[1], -0.15)
+        self.assertTrue(strip is self.layer.strip(3))
+
+    def test_hits(self):
+        self.layer.hit(1, 0.26)
+        self.layer.hit(1, -0.45)
+        self.layer.hit(1, 0.21)
+        self.layer.hit(1, 0.6)  # outside of the layer
+        self.assertEqual([strip.index for strip in self.layer.hit_strips],
+                         [7, 0])
+        self.assertEqual([strip.hits for strip in self.layer.hit_strips],
+                         [2, 1])
+        self.assertEqual(self.layer.hit_counts[7], 2)
+        self.assertEqual(self.layer.hits, 3)
+        self.assertEqual(self.detector.hits, 3)
+        self.layer.hit_strips[0].hits -= 1
+        self.assertEqual(self.layer.hit_counts[7], 1)
+        self.detector.clear_hits()
+        self.assertEqual(self.layer.hit_strips, [])
+        self.assertEqual(sum(self.layer.hit_counts), 0)
+        self.assertEqual(self.detector.hits, 0)
+
+    def test_propagate(self):
+        self.detector.propagate_tracks([LineTrack(0.0, 0.01),
+                                        LineTrack(0.0, 0.02)])
+        for layer in self.detector.get_layers():
+            self.assertEqual([(strip.index, strip.hits)
+                              for strip in layer.hit_strips], [(5, 2)])
+
+    def test_clusters(self):
+        for index, count in [(7, 1), (2, 1), (3, 3), (4, 1), (9, 2)]:
+            self.layer.add_hits(index, count)
+        clusters = self.layer.clusters()
+        self.assertEqual([(cluster.first, cluster.width, cluster.hits,
+                           cluster.total) for cluster in clusters],
+                         [(2, 3, 5, 5), (7, 1, 1, 1), (9, 1, 2, 2)])
+        # centroid 3.0 weighted by counts, strip height 0.1
+        self.assertAlmostEqual(clusters[0].pos()[1], -0.15)
+        self.assertAlmostEqual(clusters[0].y_err,
+                               3 * self.layer.strip(2).y_err)
+        self.assertEqual(len(self.layer.clusters(max_gap=1)), 2)
+        self.assertEqual(self.layer.hits, 8)
+
+    def test_edges(self):
+        edges = [-0.5, -0.4, -0.1, 0.0, 0.05, 0.5]
+        detector = LayeredDetector(1, 0, 1.0, 4, 2, 10, edges=edges, dead=[3])
+        layer = detector.layers[0]
+        self.assertEqual(layer.num_strips, 5)
+        self.assertEqual([layer.locate(y) for y in
+                          [-0.5, -0.45, -0.1, 0.02, 0.3, 0.5, -0.6]],
+                         [0, 0, 2, None, 4, None, None])
+        ys = [i * 0.01 - 0.55 for i in xrange(110)]
+        self.assertEqual(layer.locate_many(ys),
+                         [layer.locate(y) for y in ys])
+        self.assertAlmostEqual(layer.strip_pos(1)[1], -0.25)
+        self.assertAlmostEqual(layer.strip(4).y_err, 0.45 / 12 ** 0.5)
+        detector.propagate_tracks([LineTrack(0.0, 0.02), LineTrack(0.0, 0.2)])
+        self.assertEqual(layer.fired(), [(4, 1)])
+        self.assertRaises(ValueError, LayeredDetector,
+                          *(1, 0, 1.0, 4, 2, 10, [0.0, 0.2, 0.1]))
+        # uniform layers: strip edges, the top edge and dead strips, for
+        # both locate_many and the event simulation built on it (a pitch
+        # of 1/8 keeps the edges exact)
+        detector = LayeredDetector(1, 0, 1.0, 4, 2, 8, dead=[3])
+        layer = detector.layers[0]
+        ys = [layer.strip_edge(i) for i in xrange(9)]
+        self.assertEqual(layer.locate_many(ys), [0, 1, 2, None, 4, 5, 6, 7,
+                                                 None])
+        for num_strips in (8, 10, 7):
+            detector = LayeredDetector(1, 0, 1.0, 4, 2, num_strips, dead=[3])
+            layer = detector.layers[0]
+            ys = [layer.strip_edge(i) for i in xrange(num_strips + 1)]
+            ys.append(layer.top - 2 ** -54)
+            self.assertEqual(layer.locate_many(ys),
+                             [layer.locate(y) for y in ys])
+            tracks = [LineTrack(0.0, y) for y in ys]
+            for track in tracks:
+                detector.propagate_track(track)
+            self.assertEqual(detector.simulate(tracks), detector.event_hits())
+
+    def test_intercepts(self):
+        tracks = [LineTrack(0.1, 0.2), MagneticTrack(0.2, 0.1, 3.0)]
+        xs = [layer.x for layer in self.detector.get_layers()]
+        for track in tracks:
+            self.assertEqual(track.get_yintercepts(xs),
+                             [track.get_yintercept(x) for x in xs])
+        layers, intercepts = self.detector.intercepts(tracks)
+        self.assertEqual(len(intercepts), 5)
+        self.assertEqual(intercepts[2], [track.get_yintercept(layers[2].x)
+                                         for track in tracks])
+        self.assertEqual(self.detector.intercepts([])[1], [[]] * 5)
+
+    def test_batched(self):
+        tracks = gen_straight_tracks(200)
+        self.detector.propagate_tracks(tracks)
+        other = LayeredDetector(1, 0, 1.0, 4, 5, 10)
+        for track in tracks:
+            other.propagate_track(track)
+        self.assertEqual(self.detector.hits, other.hits)
+        for layer, other_layer in zip(self.detector.get_layers(),
+                                      other.get_layers()):
+            self.assertEqual(layer.hit_counts, other_layer.hit_counts)
+            self.assertEqual(layer.hits, other_layer.hits)
+            self.assertEqual([strip.index for strip in layer.hit_strips],
+                             [strip.index for strip in other_layer.hit_strips])
+
+    def test_boundaries(self):
+        # 0.0 is the lower edge of strip 5, 0.49999999999999994 the largest
+        # position below the top
+        for num_strips, y, index in [(10, 0.0, 5), (8, 0.125, 5),
+                                     (1, 0.49999999999999994, 0),
+                                     (10, 0.49999999999999994, 9),
+                                     (10, 0.5, None), (10, -0.5, 0)]:
+            detector = LayeredDetector(0, 0, 1.0, 8, 2, num_strips)
+            track = LineTrack(0.0, y)
+            detector.propagate_track(track)
+            expected = [(layer, index, 1) for layer in xrange(2)
+                        if index is not None]
+            self.assertEqual(list(detector.event_hits()), expected)
+            self.assertEqual(list(detector.simulate([track])), expected)
+            detector.clear_hits()
+            detector.propagate_tracks([track])
+            self.assertEqual(list(detector.event_hits()), expected)
+        # single and batched hits agree on all strip edges and just below
+        # the top of many layers
+        for num_strips in xrange(1, 40):
+            for height in (0.3, 1.0, 1.7, 2.9):
+                detector = LayeredDetector(0, 0, height, 1, 1, num_strips)
+                layer = detector.layers[0]
+                ys = [layer.strip_edge(i) for i in xrange(num_strips + 1)]
+                below = layer.top - abs(layer.top) * 2 ** -52
+                ys += [below, layer.top - 2 ** -60]
+                self.assertEqual(layer.locate_many(ys),
+                                 [layer.locate(y) for y in ys])
+                tracks = [LineTrack(0.0, y) for y in ys]
+                detector.propagate_tracks(tracks)
+                batched = detector.event_hits()
+                detector.clear_hits()
+                for track in tracks:
+                    detector.propagate_track(track)
+                self.assertEqual(detector.event_hits(), batched)
+                self.assertEqual(detector.simulate(tracks), batched)
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestLayer)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -0,0 +1,78 @@
+""" Event display unit tests, the rendering itself needs matplotlib. """
+# pylint: disable=C0111,R0904,C0103
+from ..display import hit_positions, render, _density_grid
+from ..detector import LayeredDetector
+from ..event import EventHits
+from array import array
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+try:
+    import matplotlib  # pylint: disable=W0611
+    HAVE_MATPLOTLIB = True
+except ImportError:
+    HAVE_MATPLOTLIB = False
+
+
+class TestDisplay(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = LayeredDetector(1, 0, 1.0, 2, 3, 4)
+
+    def test_positions(self):
+        hits = EventHits([0, 2], [1, 3], [1, 2])
+        xs, ys, counts = hit_positions(self.detector, hits)
+        self.assertEqual(list(xs), [1.0, 3.0])
+        self.assertEqual(list(ys), [-0.125, 0.375])
+        self.assertEqual(list(counts), [1, 2])
+        self.detector.load_event(hits)
+        self.assertEqual(hit_positions(self.detector), (xs, ys, counts))
+        self.assertEqual(hit_positions(self.detector, list(hits)),
+                         (xs, ys, counts))
+
+    def test_density_grid(self):
+        # one bin per layer, centred on it
+        layers = list(self.detector.get_layers())
+        nx, ny, extent = _density_grid(layers, (200, 400))
+        self.assertEqual((nx, ny), (3, 400))
+        self.assertEqual(extent, (0.5, 3.5, -0.5, 0.5))
+        width = (extent[1] - extent[0]) / nx
+        self.assertEqual([extent[0] + (i + 0.5) * width for i in xrange(nx)],
+                         [layer.x for layer in layers])
+        # more layers than bins, and a single layer
+        layers = list(LayeredDetector(1, 0, 1.0, 10, 1000, 10).get_layers())
+        self.assertEqual(_density_grid(layers, (200, 400))[0], 200)
+        single = list(LayeredDetector(1, 0, 2.0, 0, 1, 10).get_layers())
+        self.assertEqual(_density_grid(single, (200, 400)),
+                         (1, 400, (0.5, 1.5, -1.0, 1.0)))
+
+    @unittest.skipUnless(HAVE_MATPLOTLIB, "needs matplotlib")
+    def test_render(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'event.png')
+            hits = EventHits([0, 2], [1, 3], [1, 2])
+            render(self.detector, path, event=hits,
+                   tracks=[[(1.0, -0.125), (3.0, 0.375)]])
+            self.assertTrue(os.path.getsize(path) > 0)
+            # 10^6 fired strips are drawn as a density image in under a
+            # second
+            detector = LayeredDetector(1, 0, 1.0, 10, 1000, 1000)
+            n = 10 ** 6
+            hits = EventHits(array('i', [i // 1000 for i in xrange(n)]),
+                             array('i', [i % 1000 for i in xrange(n)]),
+                             array('i', [1]) * n)
+            path = os.path.join(tmpdir, 'dense.png')
+            start = time.time()
+            render(detector, path, event=hits)
+            self.assertTrue(time.time() - start < 1.0)
+            self.assertTrue(os.path.getsize(path) > 0)
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestDisplay)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -0,0 +1,49 @@
+""" Event module unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..event import EventHits
+from ..detector import LayeredDetector
+from ..track import gen_straight_tracks
+import unittest
+
+
+class TestEventHits(unittest.TestCase):
+
+    def setUp(self):
+        self.hits = EventHits([0, 0, 1, 2], [3, 4, 3, 9], [1, 2, 1, 1])
+
+    def test_columns(self):
+        self.assertEqual(len(self.hits), 4)
+        self.assertEqual(self.hits.total(), 5)
+        self.assertEqual(list(self.hits), [(0, 3, 1), (0, 4, 2), (1, 3, 1),
+                                           (2, 9, 1)])
+        self.assertEqual(self.hits[1], (0, 4, 2))
+        self.assertEqual(list(self.hits[1:3]), [(0, 4, 2), (1, 3, 1)])
+        self.assertEqual(list(self.hits.select(0)), [(0, 3, 1), (0, 4, 2)])
+        self.assertRaises(ValueError, EventHits, *([0], [1, 2], [1]))
+        self.assertRaises(ValueError, self.hits.append, *(0, 1, 1, 7))
+
+    def test_batch(self):
+        other = EventHits([1], [1], [3])
+        batch, offsets = EventHits.batch([self.hits, other, EventHits()])
+        self.assertEqual(list(offsets), [0, 4, 5, 5])
+        self.assertEqual(batch.total(), 8)
+        self.assertEqual(batch.split(offsets), [self.hits, other, EventHits()])
+        self.assertEqual(batch.track, None)
+
+    def test_detector(self):
+        detector = LayeredDetector(1, 0, 1.0, 4, 5, 10)
+        tracks = gen_straight_tracks(20)
+        hits = detector.simulate(tracks)
+        self.assertEqual(detector.hits, 0)
+        with_ids = detector.simulate(tracks, track_ids=True)
+        self.assertEqual(with_ids.total(), hits.total())
+        self.assertTrue(set(with_ids.track) <= set(range(20)))
+        detector.propagate_tracks(tracks)
+        self.assertEqual(detector.event_hits(), hits)
+        detector.load_event(with_ids)
+        self.assertEqual(detector.hits, hits.total())
+        self.assertEqual(sorted(detector.event_hits()), sorted(hits))
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestEventHits)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
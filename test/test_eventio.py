@@ -0,0 +1,100 @@
+""" Event file unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..eventio import EventWriter, EventReader, geometry, MAGIC
+from ..event import EventHits
+from ..detector import LayeredDetector
+from ..track import gen_straight_tracks
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+
+class TestEventFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'events.jkev')
+        self.detector = LayeredDetector(1, 0, 1.0, 4, 5, 10)
+        self.events = [self.detector.simulate(gen_straight_tracks(i))
+                       for i in range(6)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        with EventWriter(self.path, self.detector, buffer_size=64) as writer:
+            for hits in self.events[:4]:
+                writer.write(hits)
+        # appending to an existing file
+        with EventWriter(self.path) as writer:
+            self.assertEqual(len(writer), 4)
+            writer.write(self.events[4])
+            writer.write(list(self.events[5]))
+        with EventReader(self.path) as reader:
+            self.assertEqual(reader.geometry, geometry(self.detector))
+            self.assertEqual(len(reader), 6)
+            self.assertEqual(reader[3].hits(), self.events[3])
+            self.assertEqual(reader[-1].hits(), self.events[5])
+            for view, hits in zip(reader, self.events):
+                self.assertEqual(len(view), len(hits))
+                self.assertEqual(list(view), list(hits))
+            self.detector.load_event(reader[5])
+            self.assertEqual(self.detector.event_hits(), self.events[5])
+            self.assertRaises(IndexError, reader.__getitem__, 6)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, EventWriter, self.path)
+        with EventWriter(self.path, self.detector) as writer:
+            writer.write(EventHits())
+        other = LayeredDetector(1, 0, 1.0, 4, 6, 10)
+        self.assertRaises(ValueError, EventWriter, self.path, other)
+        with open(self.path, 'r+b') as out:
+            out.write(b'XXXX')
+        self.assertRaises(IOError, EventReader, self.path)
+        # empty and truncated files
+        open(self.path, 'wb').close()
+        self.assertRaises(IOError, EventReader, self.path)
+        with open(self.path, 'wb') as out:
+            out.write(MAGIC + b'\x02\x00')
+        self.assertRaises(IOError, EventReader, self.path)
+
+    def test_interrupted_append(self):
+        with EventWriter(self.path, self.detector) as writer:
+            for hits in self.events[:3]:
+                writer.write(hits)
+        writer = EventWriter(self.path, buffer_size=1)
+        writer.write(self.events[3])
+        # the writer dies before it is closed
+        writer._file.close()
+        with EventReader(self.path) as reader:
+            self.assertEqual([view.hits() for view in reader],
+                             self.events[:3])
+        with EventWriter(self.path) as writer:
+            writer.write(self.events[4])
+        with EventReader(self.path) as reader:
+            self.assertEqual([view.hits() for view in reader],
+                             self.events[:3] + [self.events[4]])
+
+    def test_version1(self):
+        records = [record for hits in self.events[:3] for record in hits]
+        sizes = [len(hits) for hits in self.events[:3]]
+        offsets = [64]
+        for size in sizes:
+            offsets.append(offsets[-1] + 12 * size)
+        with open(self.path, 'wb') as out:
+            out.write(struct.pack('<4sHH4d2iQQ', MAGIC, 1, 0, *(
+                geometry(self.detector) + (3, offsets[-1]))))
+            for record in records:
+                out.write(struct.pack('<iii', *record))
+            out.write(struct.pack('<4Q', *offsets))
+        with EventWriter(self.path) as writer:
+            writer.write(self.events[3])
+        with EventReader(self.path) as reader:
+            self.assertEqual([view.hits() for view in reader],
+                             self.events[:4])
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestEventFile)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -1,10 +1,14 @@
 """ A module for testing the functioning of the kfilter module. """
-from ..kfilter import LKFilter
+from ..kfilter import (LKFilter, ScalarLKFilter, CVFilter, CompiledLKFilter,
+                       EnsembleKFilter, InformationFilter, OOSMLKFilter,
+                       LKFilterBank)
 from ..matrix import Matrix
+from .. import codegen
 import random
 import sys
 # pylint: disable=C0103,W0141,R0914
 
+
 def pretty_output(headers='', *args):
     print "# " + " ".join(headers)
     output = [' '.join(map("{:.5f}".format, entry)) for entry in
@@ -12,6 +16,7 @@ def pretty_output(headers='', *args):
     string_output = '\n'.join(output)
     print string_output
 
+
 def test(N=10):
     """ Test a simple KF. """
     dt = 1.0
@@ -40,6 +45,7 @@ def test(N=10):
 
     pretty_output(["Measurements", "Results"], meas_list, results)
 
+
 def test_square(N=10):
     dt = 0.2
     x0 = 0.0
@@ -73,9 +79,260 @@ def test_square(N=10):
                   meas_list, results, v, a)
 
 
+def test_fast_filters(N=50):
+    """ Compare the float based filters with the matrix based one. """
+    dt = 0.5
+    A = Matrix([[1.0, dt],
+                [0.0, 1.0]])
+    H = Matrix([[1.0, 0.0]])
+    P = Matrix([[100.0, 0.0],
+                [0.0, 100.0]])
+    Q = Matrix([[0.0001, 0.00002],
+                [0.00002, 0.0001]])
+    R = Matrix([[2.0]])
+    meas_list = [i * dt + random.gauss(0, 1) for i in xrange(N)]
+
+    filt = LKFilter(A, H, Matrix([[0.0, 0.0]]).T, P, Q, R)
+    fast = CVFilter(dt, (0.0, 0.0), P, Q, R)
+    for meas in meas_list:
+        x, P_matrix = filt.step(Matrix([[meas]]))
+        x_fast, P_fast = fast.step(meas)
+        assert abs(x[0][0] - x_fast[0]) < 1e-9
+        assert abs(x[1][0] - x_fast[1]) < 1e-9
+        for i in range(2):
+            for j in range(2):
+                assert abs(P_matrix[i][j] - P_fast[i][j]) < 1e-9
+
+    filt = LKFilter(Matrix([[1.0]]), Matrix([[1.0]]), Matrix([[0.0]]),
+                    Matrix([[100.0]]), Matrix([[0.01]]), R)
+    fast = ScalarLKFilter(1.0, 1.0, 0.0, 100.0, 0.01, R)
+    filt.add_meas([Matrix([[meas]]) for meas in meas_list])
+    fast.add_meas(list(meas_list))
+    for (x, P_matrix), (x_fast, P_fast) in zip(filt, fast):
+        assert abs(x[0][0] - x_fast) < 1e-9
+        assert abs(P_matrix[0][0] - P_fast) < 1e-9
+
+
+def test_compiled(N=20):
+    """ Compare the generated code with the matrix based filter for
+    measurements of one, two and three dimensions. """
+    dt = 0.2
+    A = Matrix([[1.0,  dt, 0.5*dt**2],
+                [0.0, 1.0,        dt],
+                [0.0, 0.0,       1.0]])
+    Q = Matrix([[0.0001, 0.0, 0.0],
+                [0.0, 0.0001, 0.0],
+                [0.0, 0.0, 0.0001]])
+    P = Matrix([[100.0, 0., 0.],
+                [0., 100.0, 0.],
+                [0., 0., 100.0]])
+    x = Matrix([[0.0, 0.0, 0.0]]).T
+    for H in (Matrix([[1.0, 0.0, 0.0]]),
+              Matrix([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]),
+              Matrix.identity(3)):
+        m = H.size()[0]
+        R = Matrix.identity(m)
+        filt = LKFilter(A, H, x, P, Q, R)
+        fast = CompiledLKFilter(A, H, x, P, Q, R)
+        assert fast.model is CompiledLKFilter(A, H, x, P, Q, R).model
+        for i in xrange(N):
+            meas = Matrix([[(i * dt)**2 + random.gauss(0, 1)]
+                           for _ in range(m)])
+            x_new, P_new = filt.step(meas)
+            x_fast, P_fast = fast.step(meas)
+            for row, row_fast in zip(x_new.value + P_new.value,
+                                     x_fast.value + P_fast.value):
+                for entry, entry_fast in zip(row, row_fast):
+                    assert abs(entry - entry_fast) < 1e-9
+        # measurements have to be column vectors of the right size
+        for meas in (Matrix([[1.0] * m]), Matrix([[1.0]] * (m + 1))):
+            if meas.size() == (m, 1):
+                continue
+            try:
+                fast.update(meas)
+            except Exception:  # pylint: disable=W0703
+                pass
+            else:
+                raise AssertionError("wrong measurement shape accepted")
+    try:
+        CompiledLKFilter(A, H, x, P, Q, Matrix([[float('nan')]] * 3))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("NaN model entry accepted")
+    # only the most recently used models are kept
+    for i in xrange(codegen.CACHE_SIZE + 1):
+        R = Matrix([[1.0 + i, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        CompiledLKFilter(A, H, x, P, Q, R)
+    assert len(codegen._CACHE) == codegen.CACHE_SIZE  # pylint: disable=W0212
+
+
+def test_ensemble(N=10, members=1000):
+    """ Compare the ensemble filter with the exact filter. """
+    dt = 0.5
+    A = Matrix([[1.0, dt],
+                [0.0, 1.0]])
+    H = Matrix([[1.0, 0.0]])
+    x = Matrix([[0.0, 1.0]]).T
+    P = Matrix([[1.0, 0.0],
+                [0.0, 1.0]])
+    Q = Matrix([[0.01, 0.0],
+                [0.0, 0.01]])
+    R = Matrix([[0.5]])
+    filt = LKFilter(A, H, x, P, Q, R)
+    ensemble = EnsembleKFilter(A, H, x, [1.0, 1.0], [0.01, 0.01], R,
+                               members=members, seed=1)
+    for i in xrange(N):
+        meas = Matrix([[i * dt + random.gauss(0, 0.7)]])
+        x_exact, P_exact = filt.step(meas)
+        x_ens, P_ens = ensemble.step(meas)
+    # sampling error of the mean is about sqrt(P / members)
+    for i in range(2):
+        assert abs(x_exact[i][0] - x_ens[i][0]) < 5 * (P_exact[i][i] /
+                                                        members) ** 0.5
+        assert abs(P_exact[i][i] - P_ens[i][i]) < 0.2 * P_exact[i][i]
+    # the state is computed once per step, and earlier ones stay valid
+    assert ensemble.state is ensemble.state
+    variances = P_ens.diagonal()
+    ensemble.step(Matrix([[0.0]]))
+    assert ensemble.state[1] is not P_ens
+    assert P_ens.diagonal() == variances
+    # a state read from the filter can be set again
+    x_ens, P_ens = ensemble.state
+    ensemble.state = ensemble.state
+    x_new, P_new = ensemble.state
+    for i in range(2):
+        assert abs(x_ens[i][0] - x_new[i][0]) < 5 * (P_ens[i][i] /
+                                                      members) ** 0.5
+        assert abs(P_ens[i][i] - P_new[i][i]) < 0.2 * P_ens[i][i]
+    try:
+        EnsembleKFilter(A, H, x, P, Q, R, members=1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ensemble of one member accepted")
+
+    # localization weights of zero freeze the velocity
+    local = EnsembleKFilter(A, H, x, P, Q, R, members=20, seed=2,
+                            localization=lambda i, j: 1.0 if i == 0 else 0.0)
+    before = [local.ensemble[k * 2 + 1] for k in xrange(20)]
+    local.update(Matrix([[3.0]]))
+    assert before == [local.ensemble[k * 2 + 1] for k in xrange(20)]
+
+
+def test_information(N=20):
+    """ Compare the information filter with the standard filter. """
+    dt = 0.5
+    A = Matrix([[1.0, dt],
+                [0.0, 1.0]])
+    H = Matrix([[1.0, 0.0]])
+    x = Matrix([[0.0, 0.0]]).T
+    P = Matrix([[10.0, 0.0],
+                [0.0, 10.0]])
+    Q = Matrix([[0.001, 0.0],
+                [0.0, 0.001]])
+    R = Matrix([[0.5]])
+    # a singular Q is predicted in standard form
+    for Q_model in (Q, Matrix([[0.0, 0.0], [0.0, 0.001]])):
+        filt = LKFilter(A, H, x, P, Q_model, R)
+        info = InformationFilter(A, H, x, P, Q_model, R)
+        for i in xrange(N):
+            meas = Matrix([[i * dt + random.gauss(0, 0.7)]])
+            x_ref, P_ref = filt.step(meas)
+            x_info, P_info = info.step(meas)
+            for row, row_info in zip(x_ref.value + P_ref.value,
+                                     x_info.value + P_info.value):
+                for entry, entry_info in zip(row, row_info):
+                    assert abs(entry - entry_info) < 1e-6 * max(1, abs(entry))
+
+    # fusing two sensors equals one update with the stacked measurement
+    H2 = Matrix([[0.0, 1.0]])
+    R2 = Matrix([[0.3]])
+    stacked = LKFilter(A, Matrix([[1.0, 0.0], [0.0, 1.0]]), x, P, Q,
+                       Matrix([[0.5, 0.0], [0.0, 0.3]]))
+    stacked.update(Matrix([[1.0], [2.0]]))
+    info = InformationFilter.from_information(A, H, x, P.I, Q, R)
+    info.fuse([(Matrix([[1.0]]), H, R), (Matrix([[2.0]]), H2, R2)])
+    for row, row_info in zip(stacked.x.value + stacked.P.value,
+                             info.state[0].value + info.state[1].value):
+        for entry, entry_info in zip(row, row_info):
+            assert abs(entry - entry_info) < 1e-9
+
+
+def test_late(N=50):
+    """ Late measurements give the same estimate as in-order ones. """
+    dt = 0.5
+    A = Matrix([[1.0, dt],
+                [0.0, 1.0]])
+    H = Matrix([[1.0, 0.0]])
+    x = Matrix([[0.0, 0.0]]).T
+    P = Matrix([[10.0, 0.0],
+                [0.0, 10.0]])
+    Q = Matrix([[0.001, 0.0],
+                [0.0, 0.001]])
+    R = Matrix([[0.5]])
+    meas_list = [Matrix([[i * dt + random.gauss(0, 0.7)]]) for i in xrange(N)]
+    filt = LKFilter(A, H, x, P, Q, R)
+    for meas in meas_list:
+        filt.step(meas)
+
+    late = OOSMLKFilter(A, H, x, P, Q, R, max_lag=5)
+    delayed = []
+    for i, meas in enumerate(meas_list):
+        if i % 7 == 3:
+            # arrives three steps late
+            late.step(None, time=i)
+            delayed.append((i + 3, meas, i))
+        else:
+            late.step(meas, time=i)
+        for arrival, meas, time in [d for d in delayed if d[0] == i]:
+            assert late.late_update(meas, time)
+    assert not late.late_update(meas_list[0], 0)
+    for row, row_late in zip(filt.x.value + filt.P.value,
+                             late.x.value + late.P.value):
+        for entry, entry_late in zip(row, row_late):
+            assert abs(entry - entry_late) < 1e-9
+
+
+def test_bank(N=100, filters=5):
+    """ Compare single and double precision filter banks with LKFilter. """
+    dt = 0.5
+    A = Matrix([[1.0, dt],
+                [0.0, 1.0]])
+    H = Matrix([[1.0, 0.0]])
+    P = Matrix([[10.0, 0.0],
+                [0.0, 10.0]])
+    Q = Matrix([[0.001, 0.0],
+                [0.0, 0.001]])
+    R = Matrix([[0.5]])
+    starts = [Matrix([[float(i), 1.0]]).T for i in xrange(filters)]
+    exact = [LKFilter(A, H, x, P, Q, R) for x in starts]
+    banks = [LKFilterBank(A, H, Q, R), LKFilterBank(A, H, Q, R, 'single')]
+    for bank in banks:
+        for x in starts:
+            bank.add(x, P)
+    for i in xrange(N):
+        meas = [Matrix([[j + i * dt + random.gauss(0, 0.7)]])
+                for j in xrange(filters)]
+        for filt, z in zip(exact, meas):
+            filt.step(z)
+        for bank in banks:
+            bank.step_all(meas)
+    for bank, tolerance in zip(banks, (1e-9, 5e-5)):
+        for index, filt in enumerate(exact):
+            x, P_bank = bank.state(index)
+            for row, row_bank in zip(filt.x.value + filt.P.value,
+                                     x.value + P_bank.value):
+                for entry, entry_bank in zip(row, row_bank):
+                    assert abs(entry - entry_bank) <= tolerance * max(
+                        1.0, abs(entry))
+
 
 if __name__ == "__main__":
-    funcs = {'1':test, '2':test_square}
+    funcs = {'1':test, '2':test_square, '3':test_fast_filters,
+             '4':test_compiled, '5':test_ensemble,
+             '6':test_information, '7':test_late,
+             '8':test_bank}
     if len(sys.argv) == 3:
         funcs[sys.argv[1]](int(sys.argv[2]))
     else:
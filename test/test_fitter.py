@@ -0,0 +1,149 @@
+""" FitManager unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..matrix import Matrix
+from ..detector import LayeredDetector
+from ..track import LineTrack
+from ..fitter import FitManager, FitResult
+from ..kfilter import TwoWayLKFilter
+from ..eventio import EventReader, EventWriter
+import os
+import tempfile
+import unittest
+
+
+class TestFitManager(unittest.TestCase):
+
+    def setUp(self):
+        Lx, Ly, Nx, Ny = 8, 1.0, 15, 25
+        y_err = Ly / (Ny * 12 ** 0.5)
+        dx = float(Lx) / (Nx - 1)
+        self.detector = LayeredDetector(1, 0, Ly, Lx, Nx, Ny)
+        self.tracks = [LineTrack(0.05, -0.3), LineTrack(-0.04, 0.25),
+                       LineTrack(0.0, 0.02)]
+        A = Matrix([[1.0, dx], [0.0, 1.0]])
+        H = Matrix([[1.0, 0.0]])
+        Q = Matrix([[0.00005, 0.0], [0.0, 0.00005]])
+        R = Matrix([[y_err]])
+        # every manager reverses its filter, so each gets its own
+        self.filt = lambda: TwoWayLKFilter(A, H, Matrix([[0, 0]]).T, None, Q,
+                                           R)
+
+    def fitted(self, manager, event=None):
+        return [fitter.measurements_list for fitter in manager.fit(event)]
+
+    def test_non_destructive(self):
+        self.detector.propagate_tracks(self.tracks)
+        before = self.detector.event_hits()
+        manager = FitManager(self.detector, self.filt())
+        first = self.fitted(manager)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(self.detector.event_hits(), before)
+        self.assertEqual(self.fitted(manager), first)
+        # a second manager shares the detector
+        other = FitManager(self.detector, self.filt(), clustering=True)
+        self.assertEqual(len(self.fitted(other)), 3)
+        self.assertEqual(self.fitted(manager), first)
+
+    def test_adjacent(self):
+        # two tracks fire neighbouring strips (height 0.04) in every layer
+        tracks = [LineTrack(0.0, 0.01), LineTrack(0.0, 0.05)]
+        self.detector.propagate_tracks(tracks)
+        for layer in self.detector.get_layers():
+            self.assertEqual([cluster.hits for cluster in layer.clusters()],
+                             [2])
+        manager = FitManager(self.detector, self.filt(), clustering=True)
+        self.assertEqual(len(self.fitted(manager)), 2)
+
+    def test_cluster_errors(self):
+        # strips of 0.02 and 0.06 next to each other, the mean pitch is 0.2
+        edges = [-0.5, -0.1, -0.02, 0.0, 0.06, 0.5]
+        detector = LayeredDetector(1, 0, 1.0, 8, 15, 25, edges=edges)
+        detector.propagate_tracks([LineTrack(0.0, -0.01),
+                                   LineTrack(0.0, 0.03)])
+        errors = []
+
+        class Recording(TwoWayLKFilter):
+
+            def update(self, measurement):
+                errors.append(self.R[0][0])
+                return TwoWayLKFilter.update(self, measurement)
+
+        filt = self.filt()
+        filt.__class__ = Recording
+        manager = FitManager(detector, filt, clustering=True)
+        self.assertEqual(len(self.fitted(manager)), 2)
+        # the cluster spans 0.08, 0.4 times the mean pitch
+        y_err = filt.R[0][0]
+        self.assertTrue(errors)
+        for error in errors:
+            self.assertAlmostEqual(error, 0.16 * y_err)
+
+    def test_assignment(self):
+        self.detector.propagate_tracks(self.tracks)
+        fitted = self.fitted(FitManager(self.detector, self.filt()))
+        self.assertEqual(len(fitted), 3)
+        # every fitted track follows one true track, the greedy assignment
+        # swaps hits where the first two tracks cross
+        xs = [layer.x for layer in self.detector.get_layers(reverse=True)]
+        for measurements in fitted:
+            self.assertTrue(any(
+                all(abs(y - track.get_yintercept(x)) < 0.04
+                    for x, y in zip(xs, measurements))
+                for track in self.tracks))
+        greedy = FitManager(self.detector, self.filt(), assignment='greedy')
+        self.assertNotEqual(sorted(self.fitted(greedy)), sorted(fitted))
+        self.assertRaises(ValueError, FitManager,
+                          *(self.detector, self.filt(), False, 'best'))
+
+    def test_event(self):
+        event = self.detector.simulate(self.tracks, track_ids=True)
+        manager = FitManager(self.detector, self.filt())
+        fitted = self.fitted(manager, event)
+        self.assertEqual(self.detector.hits, 0)
+        self.detector.propagate_tracks(self.tracks)
+        self.assertEqual(self.fitted(manager), fitted)
+
+    def test_fit_many(self):
+        events = [self.detector.simulate(self.tracks[:n]) for n in (3, 1, 0, 2)]
+        manager = FitManager(self.detector, self.filt())
+        expected = [self.fitted(manager, event) for event in events]
+        results = list(manager.fit_many(events, workers=1))
+        self.assertEqual([result.measurements_list for result in results],
+                         expected)
+        packed = results[0]
+        self.assertEqual(FitResult.fromstring(packed.tostring()), packed)
+        x, _ = manager.fit(events[0])[0].state
+        self.assertEqual(packed.state(0)[0], x)
+        # the state size is stored with the result
+        wide = FitResult.fromstring(FitResult(3, [0, 1], [0.5],
+                                              range(12)).tostring())
+        self.assertEqual(wide.state(0), (Matrix([[0, 1, 2]]).T,
+                                         Matrix([[3, 4, 5], [6, 7, 8],
+                                                 [9, 10, 11]])))
+        # in worker processes, streamed and from an event file
+        self.assertEqual(list(manager.fit_many(iter(events), workers=2,
+                                               chunksize=1)), results)
+        self.assertEqual(list(manager.fit_many([events[2]], workers=2)),
+                         results[2:3])
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            with EventWriter(path, self.detector) as writer:
+                for event in events:
+                    writer.write(event)
+            with EventReader(path) as reader:
+                self.assertEqual(list(manager.fit_many(reader, workers=2)),
+                                 results)
+            other = LayeredDetector(1, 0, 1.0, 8, 10, 25)
+            self.assertRaises(ValueError, list, FitManager(
+                other, self.filt()).fit_many(path, workers=1))
+            # dead strips are not recorded in event files
+            dead = LayeredDetector(1, 0, 1.0, 8, 15, 25, dead=[3])
+            self.assertRaises(ValueError, list, FitManager(
+                dead, self.filt()).fit_many(path, workers=1))
+        finally:
+            os.remove(path)
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestFitManager)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
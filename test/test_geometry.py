@@ -0,0 +1,81 @@
+""" Geometry module unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..geometry import Geometry
+from ..detector import Layer, LayeredDetector
+from ..track import gen_straight_tracks
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestGeometry(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = LayeredDetector(1, 0.3, 1.1, 7, 6, 13)
+        self.geometry = Geometry.from_detector(self.detector)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_arrays(self):
+        layers = list(self.detector.get_layers())
+        self.assertEqual(len(self.geometry), 6)
+        self.assertEqual(list(self.geometry.x_layers),
+                         [layer.x for layer in layers])
+        self.assertEqual(list(self.geometry.pitch),
+                         [layer.strip_height for layer in layers])
+        edges = self.geometry.edges(2)
+        self.assertEqual(len(edges), 14)
+        self.assertEqual(edges[0], layers[2].bottom)
+        self.assertAlmostEqual(edges[-1], layers[2].top)
+
+    def test_cache(self):
+        path = os.path.join(self.tmpdir, 'detector.jkgm')
+        self.geometry.save(path)
+        loaded = Geometry.load(path)
+        self.assertEqual(loaded, self.geometry)
+        detector = LayeredDetector.from_geometry(loaded)
+        for layer, other in zip(self.detector.get_layers(),
+                                detector.get_layers()):
+            self.assertEqual((layer.x, layer.bottom, layer.top,
+                              layer.strip_height, layer.num_strips),
+                             (other.x, other.bottom, other.top,
+                              other.strip_height, other.num_strips))
+        tracks = gen_straight_tracks(50)
+        self.assertEqual(detector.simulate(tracks),
+                         self.detector.simulate(tracks))
+        with open(path, 'r+b') as cache:
+            cache.write(b'XXXX')
+        self.assertRaises(IOError, Geometry.load, path)
+
+    def test_edges(self):
+        path = os.path.join(self.tmpdir, 'detector.jkgm')
+        detector = LayeredDetector(1, 0, 1.0, 4, 3, 10,
+                                   edges=[-0.5, -0.1, 0.0, 0.3], dead=[1])
+        geometry = Geometry.from_detector(detector)
+        self.assertEqual(list(geometry.uniform), [0, 0, 0])
+        self.assertEqual(geometry.dead(2), [1])
+        geometry.save(path)
+        loaded = LayeredDetector.from_geometry(Geometry.load(path))
+        self.assertEqual(Geometry.from_detector(loaded), geometry)
+        tracks = gen_straight_tracks(50)
+        self.assertEqual(loaded.simulate(tracks), detector.simulate(tracks))
+
+    def test_sorted(self):
+        self.detector.layers.reverse()
+        layers = list(self.detector.get_layers())
+        self.assertEqual(layers, sorted(layers, key=lambda layer: layer.x))
+        self.detector.sort_layers()
+        self.assertEqual(list(self.detector.get_layers()), layers)
+        # changes of the layer list are picked up without sort_layers
+        extra = Layer(-1.0, 0, 1.0, 10, parent=self.detector)
+        self.detector.layers.append(extra)
+        self.assertEqual(next(self.detector.get_layers()), extra)
+        self.detector.layers.remove(extra)
+        self.assertEqual(list(self.detector.get_layers()), layers)
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestGeometry)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -0,0 +1,54 @@
+""" HitIndex unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..hitindex import HitIndex
+import random
+import unittest
+
+
+class TestHitIndex(unittest.TestCase):
+
+    def test_queries(self):
+        index = HitIndex([0.3, -0.2, 0.1, 0.5])
+        self.assertEqual(list(index.positions), [-0.2, 0.1, 0.3, 0.5])
+        self.assertEqual(index.window(0.0, 0.3), [2, 0])
+        self.assertEqual(index.query(0.0, 0.2), [1, 2])
+        self.assertEqual(index.match([0.0, -1.0, 0.45], [0.3, 0.0, 0.6]),
+                         [[2, 0], [1], [3]])
+
+    def test_nearest(self):
+        index = HitIndex([0.3, -0.2, 0.1, 0.5], [0, 1, 1, 2])
+        self.assertEqual(index.nearest(0.24), 2)
+        self.assertEqual(index.nearest(9.0), 3)
+        index.use(3)
+        self.assertEqual(index.nearest(9.0), 3)
+        index.use(3)
+        self.assertEqual(index.nearest(9.0), 2)
+        index.use(2)
+        index.use(1)
+        self.assertEqual(index.nearest(0.0), None)
+        self.assertEqual(HitIndex([]).nearest(0.0), None)
+        # ties go to the lowest index, also among equal positions
+        self.assertEqual(HitIndex([0.75, 0.25]).nearest(0.5), 0)
+        self.assertEqual(HitIndex([0.25, 0.25, 0.75]).nearest(0.5), 0)
+        self.assertEqual(HitIndex([0.75, 0.25, 0.25]).nearest(0.5), 0)
+        self.assertEqual(HitIndex([0.75, 0.25, 0.25]).nearest(0.3), 1)
+
+    def test_random(self):
+        rng = random.Random(3)
+        for _ in xrange(200):
+            positions = [rng.randint(0, 8) * 0.125 for _ in xrange(10)]
+            counts = [rng.randint(0, 2) for _ in positions]
+            index = HitIndex(positions, counts)
+            for _ in xrange(15):
+                y = rng.uniform(-0.2, 1.2)
+                live = [hit for hit, count in enumerate(counts) if count > 0]
+                expected = min(live, key=lambda hit: (
+                    abs(y - positions[hit]), hit)) if live else None
+                self.assertEqual(index.nearest(y), expected)
+                if expected is not None:
+                    index.use(expected)
+                    counts[expected] -= 1
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestHitIndex)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -0,0 +1,71 @@
+""" Instrument module unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from .. import instrument
+from ..kfilter import LKFilter
+from ..matrix import Matrix
+import json
+import unittest
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        instrument.reset()
+        self.filt = LKFilter(Matrix([[1.0, 1.0], [0.0, 1.0]]),
+                             Matrix([[1.0, 0.0]]),
+                             Matrix([[0.0, 0.0]]).T,
+                             Matrix.identity(2),
+                             Matrix([[0.01, 0.0], [0.0, 0.01]]),
+                             Matrix([[1.0]]))
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_disabled(self):
+        original = LKFilter.__dict__['step']
+        instrument.enable()
+        self.assertNotEqual(LKFilter.__dict__['step'], original)
+        instrument.disable()
+        self.assertEqual(LKFilter.__dict__['step'], original)
+        self.filt.step(Matrix([[1.0]]))
+        self.assertEqual(instrument.snapshot(), {})
+
+    def test_counters(self):
+        instrument.enable()
+        for i in range(3):
+            self.filt.step(Matrix([[float(i)]]))
+        self.filt.step()
+        stats = instrument.snapshot()
+        self.assertEqual(stats['LKFilter.step']['calls'], 4)
+        self.assertEqual(stats['LKFilter.update']['calls'], 3)
+        self.assertEqual(stats['LKFilter.predict']['calls'], 4)
+        self.assertEqual(stats['Matrix.inverse']['shapes'], {'1x1': 3})
+        self.assertIn('2x2,2x2', stats['Matrix.mul']['shapes'])
+        document = json.loads(instrument.to_json(release='test'))
+        self.assertEqual(document['meta'], {'release': 'test'})
+        self.assertEqual(document['stats']['LKFilter.step']['calls'], 4)
+        instrument.reset()
+        self.assertEqual(instrument.snapshot(), {})
+
+    def test_errors(self):
+        class Model(object):
+            def run(self, fail):
+                if fail:
+                    raise KeyError("original")
+                return 1
+        instrument.enable()
+        # a failing shape function changes neither results nor errors
+        instrument.register(Model, 'run', shape=lambda *_: 1 / 0)
+        self.assertEqual(Model().run(False), 1)
+        self.assertRaises(KeyError, Model().run, True)
+        self.assertRaises(ValueError, Matrix.identity(2).__mul__,
+                          Matrix([[1.0, 2.0, 3.0]]))
+        stats = instrument.snapshot()
+        self.assertEqual(stats['Model.run']['calls'], 2)
+        self.assertNotIn('shapes', stats['Model.run'])
+        self.assertEqual(stats['Matrix.mul']['shapes'], {'2x2,1x3': 1})
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestInstrument)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -101,6 +101,15 @@ class TestMatrixFunctions(unittest.TestCase):
         self.assertEqual(self.matrix, U)
         self.assertEqual(self.matrix, L * U)
 
+    def test_pack(self):
+        self.matrix = matrix.Matrix([[1.5, 2, 3], [4, 5, 6.25]])
+        packed = self.matrix.pack()
+        self.assertEqual(list(packed), [1.5, 2, 3, 4, 5, 6.25])
+        self.assertEqual(matrix.Matrix.unpack(packed, 2, 3), self.matrix)
+        self.assertEqual(matrix.Matrix.unpack(self.matrix.pack('f'), 2, 3),
+                         self.matrix)
+        self.assertRaises(ValueError, matrix.Matrix.unpack, *(packed, 2, 2))
+
 if __name__ == "__main__":
     SUITE = unittest.TestLoader().loadTestsFromTestCase(TestMatrixFunctions)
     unittest.TextTestRunner(verbosity=2).run(SUITE)
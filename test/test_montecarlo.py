@@ -0,0 +1,47 @@
+""" Monte Carlo generation unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..montecarlo import generate_events, write_events, event_seed
+from ..eventio import EventReader
+from ..detector import LayeredDetector
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def poisson_like(rng):
+    return rng.randint(0, 8)
+
+
+class TestGeneration(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = LayeredDetector(1, 0, 1.0, 4, 5, 20)
+
+    def test_reproducible(self):
+        serial = list(generate_events(self.detector, 30, seed=7, chunksize=4,
+                                      tracks_per_event=poisson_like))
+        parallel = list(generate_events(self.detector, 30, seed=7, workers=3,
+                                        chunksize=5,
+                                        tracks_per_event=poisson_like))
+        self.assertEqual(serial, parallel)
+        other = list(generate_events(self.detector, 30, seed=8))
+        self.assertNotEqual(serial, other)
+        self.assertNotEqual(event_seed(7, 1), event_seed(7, 2))
+        self.assertEqual(self.detector.hits, 0)
+
+    def test_write(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'sample.jkev')
+            self.assertEqual(write_events(path, self.detector, 10, seed=1), 10)
+            expected = list(generate_events(self.detector, 10, seed=1))
+            with EventReader(path) as reader:
+                self.assertEqual([sorted(view) for view in reader],
+                                 [sorted(hits) for hits in expected])
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestGeneration)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -0,0 +1,44 @@
+""" Parallel filtering unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..parallel import parallel_filter
+from ..kfilter import LKFilter
+from ..matrix import Matrix
+import random
+import unittest
+
+
+class TestParallelFilter(unittest.TestCase):
+
+    def setUp(self):
+        dt = 0.5
+        self.filt = LKFilter(Matrix([[1.0, dt], [0.0, 1.0]]),
+                             Matrix([[1.0, 0.0]]),
+                             Matrix([[0.0, 0.0]]).T,
+                             Matrix([[10.0, 0.0], [0.0, 10.0]]),
+                             Matrix([[0.001, 0.0], [0.0, 0.001]]),
+                             Matrix([[0.5]]))
+        self.measurements = [Matrix([[i * dt + random.gauss(0, 0.5)]])
+                             for i in range(40)]
+        self.measurements[10] = None
+        self.measurements[20] = None
+
+    def check(self, states):
+        expected = [self.filt.step(measurement)
+                    for measurement in self.measurements]
+        self.assertEqual(len(states), len(expected))
+        for (x, P), (x_ref, P_ref) in zip(states, expected):
+            for row, row_ref in zip(x.value + P.value,
+                                    x_ref.value + P_ref.value):
+                for entry, entry_ref in zip(row, row_ref):
+                    self.assertAlmostEqual(entry, entry_ref, places=7)
+
+    def test_chunks(self):
+        self.check(parallel_filter(self.filt, self.measurements, workers=1,
+                                   chunks=7))
+
+    def test_processes(self):
+        self.check(parallel_filter(self.filt, self.measurements, workers=2))
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestParallelFilter)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -0,0 +1,62 @@
+""" Smoother module unit tests. """
+# pylint: disable=C0111,R0904,C0103
+from ..smoother import batch_smooth
+from ..kfilter import LKFilter
+from ..matrix import Matrix
+import random
+import unittest
+
+
+def rts(A, H, Q, R, x, P, measurements):
+    """ Reference Rauch-Tung-Striebel smoother built from LKFilter. """
+    filt = LKFilter(A, H, x, P, Q, R)
+    filtered = []
+    for measurement in measurements:
+        if measurement is not None:
+            filt.update(measurement)
+        filtered.append(filt.state)
+        filt.predict()
+    states = [filtered[-1][0]]
+    covariances = [filtered[-1][1]]
+    for x_f, P_f in reversed(filtered[:-1]):
+        P_pred = A * P_f * A.T + Q
+        G = P_f * A.T * P_pred.I
+        states.insert(0, x_f + G * (states[0] - A * x_f))
+        covariances.insert(0, P_f + G * (covariances[0] - P_pred) * G.T)
+    return states, covariances
+
+
+class TestBatchSmooth(unittest.TestCase):
+
+    def assertClose(self, first, second):
+        for row1, row2 in zip(first.value, second.value):
+            for entry1, entry2 in zip(row1, row2):
+                self.assertAlmostEqual(entry1, entry2, places=7)
+
+    def test_rts(self):
+        dt = 0.5
+        A = Matrix([[1.0, dt], [0.0, 1.0]])
+        H = Matrix([[1.0, 0.0]])
+        Q = Matrix([[0.001, 0.0], [0.0, 0.001]])
+        R = Matrix([[0.5]])
+        x = Matrix([[0.0, 0.0]]).T
+        P = Matrix([[10.0, 0.0], [0.0, 10.0]])
+        measurements = [Matrix([[i * dt + random.gauss(0, 0.5)]])
+                        for i in range(30)]
+        measurements[5] = None
+        measurements[6] = None
+        states, covariances = batch_smooth(A, H, Q, R, x, P, measurements)
+        ref_states, ref_covariances = rts(A, H, Q, R, x, P, measurements)
+        self.assertEqual(len(states), len(measurements))
+        for state, ref in zip(states, ref_states):
+            self.assertClose(state, ref)
+        for cov, ref in zip(covariances, ref_covariances):
+            self.assertClose(cov, ref)
+
+    def test_empty(self):
+        self.assertEqual(batch_smooth(None, None, None, None, None, None, []),
+                         ([], []))
+
+if __name__ == "__main__":
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(TestBatchSmooth)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -1,16 +1,20 @@
 """A module implementing various physical tracks that represent objects being
 tracked. This module is meant to gather all possible tracks. Two dimensional
 tracks should extend the :py:class:`.Track` abstract base class. Currently the
-:py:class:`LineTrack` class has been implemented."""
+:py:class:`LineTrack` class has been implemented. Large samples of tracks can
+be stored in a :py:class:`TrackCollection`."""
 # pylint: disable=R0903,C0103
 import random
 import math
+from array import array
 
 
 class Track(object):
 
     """A two dimension track interface interface. The interface enforces that
     subclasses implement a constructor and a :py:meth:`get_yintercept` function.
+    Subclasses should also override :py:meth:`get_yintercepts` with a faster
+    version that evaluates many positions at once.
     """
 
     def __init__(self):
@@ -26,6 +30,17 @@ class Track(object):
         """
         raise NotImplementedError
 
+    def get_yintercepts(self, xs):
+        """Return the **y** intercepts of the track at many **x** positions,
+        e.g. at all layers of a detector.
+
+        :param xs: coordinates at which to calculate the interception points
+        :type xs: list(float)
+        :return: **y** value of the track for each **x**
+        :rtype: *list(float)*
+        """
+        return [self.get_yintercept(x) for x in xs]
+
 
 class LineTrack(Track):
 
@@ -43,43 +58,237 @@ class LineTrack(Track):
     def get_yintercept(self, x):
         return self.a * x + self.b
 
+    def get_yintercepts(self, xs):
+        a, b = self.a, self.b
+        return [a * x + b for x in xs]
+
+
+def _arc(a, b, B):
+    """ Return the squared radius and the centre of the arc of a magnetic
+    track, shared by :py:class:`MagneticTrack` and
+    :py:class:`TrackCollection`. """
+    if B == 0:
+        raise ValueError("A magnetic track needs a field different from 0")
+    alpha = math.atan(a)
+
+    vx0, vy0 = (a * math.cos(alpha), a * math.sin(alpha))
+    return (a/B)**2, vy0/B, b-vx0/B
+
 
 class MagneticTrack(LineTrack):
-    """A track moving in a magnetic field. Experimental and untested."""
+    """A track moving in a magnetic field. Experimental and untested.
+
+    The track is a circle arc; its radius and centre only depend on the
+    parameters, so they are computed once by the constructor. Call
+    :py:meth:`precompute` after changing **a**, **b** or **B**."""
 
     def __init__(self, a, b, B):
         """Create a straight line track that propagates in a magnetic field of
         strength `B` in z direction."""
         super(MagneticTrack, self).__init__(a, b)
         self.B = B
+        self.precompute()
 
+    def precompute(self):
+        """Compute the constants of the arc from the track parameters.
+
+        :raises ValueError: if **B** is 0"""
+        self._radius2, self._x0, self._y0 = _arc(self.a, self.b, self.B)
 
     def get_yintercept(self, x):
         """Return y intercept of track with detector at x, taking into account
         the curvature caused by the magnetic field."""
-        alpha = math.atan(self.a)
+        return abs(self._radius2 - (x - self._x0)**2)**0.5 + self._y0
+
+    def get_yintercepts(self, xs):
+        radius2, x0, y0 = self._radius2, self._x0, self._y0
+        return [abs(radius2 - (x - x0)**2)**0.5 + y0 for x in xs]
+
+class TrackCollection(object):
+
+    """Many tracks stored column by column: the parameters **a**, **b** and
+    **B** of all tracks are kept in contiguous ``array('d')`` columns and the
+    type of every track in an ``array('b')`` of type codes (:py:attr:`LINE`
+    or :py:attr:`MAGNETIC`), so a track costs 25 bytes instead of a Python
+    object with its own ``__dict__``. Straight tracks have **B** equal to 0.
+
+    A collection can be passed wherever a list of tracks is expected:
+    iterating or indexing creates the corresponding :py:class:`LineTrack` or
+    :py:class:`MagneticTrack` objects on demand, slicing and
+    :py:meth:`compress` return new collections.
+    :py:meth:`get_yintercepts_at` evaluates all tracks at once, which is what
+    :py:meth:`detector.LayeredDetector.propagate_tracks` uses::
+
+        >>> tracks = TrackCollection.from_tracks(gen_straight_tracks(10 ** 6))
+        >>> steep = tracks.compress([abs(a) > 0.2 for a in tracks.a])
+        >>> detector.propagate_tracks(steep)
+
+    :param a: slopes of the tracks
+    :param b: **y** intercepts at 0
+    :param B: magnetic field strengths, 0 for straight tracks
+    :param kind: type codes, derived from *B* if not given
+
+    The columns should only be changed through :py:meth:`append` and
+    :py:meth:`extend`, which keep the cached constants of the magnetic tracks
+    up to date.
+    """
+
+    LINE = 0
+    MAGNETIC = 1
+
+    def __init__(self, a=(), b=(), B=None, kind=None):
+        self.a = array('d', a)
+        self.b = array('d', b)
+        if B is None:
+            self.B = array('d', [0.0]) * len(self.a)
+        else:
+            self.B = array('d', B)
+        if kind is None:
+            kind = [self.LINE if field == 0 else self.MAGNETIC
+                    for field in self.B]
+        self.kind = array('b', kind)
+        if len(set([len(self.a), len(self.b), len(self.B),
+                    len(self.kind)])) != 1:
+            raise ValueError("Columns are not the same length")
+        # constants of the magnetic tracks, computed when needed
+        self._arcs = None
 
-        vx0, vy0 = (self.a * math.cos(alpha), self.a * math.sin(alpha))
-        yy = (abs((self.a/self.B)**2 - (x - vy0/self.B)**2)**0.5
-              + (self.b-vx0/self.B))
-        return yy
+    @classmethod
+    def from_tracks(cls, tracks):
+        """ Return a collection holding the parameters of *tracks*, which
+        have to be :py:class:`LineTrack` or :py:class:`MagneticTrack`
+        objects. """
+        collection = cls()
+        collection.extend(tracks)
+        return collection
 
-def gen_straight_tracks(N=10):
+    def __len__(self):
+        return len(self.a)
+
+    def __getitem__(self, key):
+        """ Return track *key*, or a new :py:class:`TrackCollection` if *key*
+        is a slice. """
+        if isinstance(key, slice):
+            return TrackCollection(self.a[key], self.b[key], self.B[key],
+                                   self.kind[key])
+        if self.kind[key] == self.MAGNETIC:
+            return MagneticTrack(self.a[key], self.b[key], self.B[key])
+        return LineTrack(self.a[key], self.b[key])
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        return (isinstance(other, TrackCollection) and
+                (self.a, self.b, self.B, self.kind) ==
+                (other.a, other.b, other.B, other.kind))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "{}({} tracks)".format(self.__class__.__name__, len(self))
+
+    def append(self, track):
+        """ Append the parameters of a :py:class:`LineTrack` or
+        :py:class:`MagneticTrack`. """
+        self.a.append(track.a)
+        self.b.append(track.b)
+        if isinstance(track, MagneticTrack):
+            self.B.append(track.B)
+            self.kind.append(self.MAGNETIC)
+        elif isinstance(track, LineTrack):
+            self.B.append(0.0)
+            self.kind.append(self.LINE)
+        else:
+            raise TypeError("Only straight and magnetic tracks can be stored")
+        self._arcs = None
+
+    def extend(self, tracks):
+        """ Append many tracks, or all tracks of another collection. """
+        if isinstance(tracks, TrackCollection):
+            self.a.extend(tracks.a)
+            self.b.extend(tracks.b)
+            self.B.extend(tracks.B)
+            self.kind.extend(tracks.kind)
+            self._arcs = None
+            return
+        for track in tracks:
+            self.append(track)
+
+    def compress(self, mask):
+        """ Return a new collection with the tracks for which *mask* is true.
+
+        :param mask: one truth value per track
+        :rtype: TrackCollection
+        """
+        rows = [i for i, keep in enumerate(mask) if keep]
+        return TrackCollection([self.a[i] for i in rows],
+                               [self.b[i] for i in rows],
+                               [self.B[i] for i in rows],
+                               [self.kind[i] for i in rows])
+
+    def _arc_constants(self):
+        """ Return the constants of the arcs of the magnetic tracks as in
+        :py:meth:`MagneticTrack.precompute`: their indices, squared radii and
+        centres. A magnetic track with a field of 0 raises a
+        ``ValueError``. """
+        if self._arcs is None:
+            rows = [i for i, kind in enumerate(self.kind)
+                    if kind == self.MAGNETIC]
+            radius2, x0, y0 = array('d'), array('d'), array('d')
+            for i in rows:
+                constants = _arc(self.a[i], self.b[i], self.B[i])
+                radius2.append(constants[0])
+                x0.append(constants[1])
+                y0.append(constants[2])
+            self._arcs = (rows, radius2, x0, y0)
+        return self._arcs
+
+    def get_yintercepts_at(self, x):
+        """Return the **y** intercepts of all tracks at one **x** position,
+        e.g. at one layer of a detector (unlike
+        :py:meth:`Track.get_yintercepts`, which takes a sequence of **x**
+        positions). Straight tracks are evaluated in one pass over the
+        columns, magnetic tracks with their precomputed arc constants.
+
+        :param float x: coordinate at which to calculate the interception
+         points
+        :return: **y** value of every track
+        :rtype: *array*
+        :raises ValueError: if a magnetic track has a field of 0
+        """
+        ys = array('d', [a * x + b for a, b in zip(self.a, self.b)])
+        rows, radius2, x0, y0 = self._arc_constants()
+        for i, r2, xc, yc in zip(rows, radius2, x0, y0):
+            ys[i] = abs(r2 - (x - xc)**2)**0.5 + yc
+        return ys
+
+
+def gen_straight_tracks(N=10, rng=None):
     """Helper function to generate multiple :py:class:`LineTrack` objects that
     can then be used, e.g. for propagating in a detector. The tracks are
     generated using random numbers to generate the track parameters **a** and
-    **b**. Currently the parameter ranges are not adjustable and are the following:
+    **b**. The parameter ranges are not adjustable (see
+    :py:class:`TrackGenerator` for configurable distributions) and are the
+    following:
 
     * **a** from -0.268 to 0.268 (corresponds to an angle of -15 to 15 degrees)
     * **b** from -0.1 to 0.1
 
     :param int N: amount of tracks to return
+    :param rng: random number generator (a ``random.Random`` instance) to draw
+     the parameters from, for reproducible tracks. By default the global
+     generator of the :py:mod:`random` module is reseeded from system entropy.
     :return: generated tracks
     :rtype: *list(LineTrack)*
     """
     tracks = [None] * N
-    random.seed()
-    random_nums = ((random.random(), random.random()) for i in xrange(N))
+    if rng is None:
+        random.seed()
+        rng = random
+    random_nums = ((rng.random(), rng.random()) for i in xrange(N))
     for i in xrange(N):
         a, b = next(random_nums)
         # generate b of track from uniform
@@ -89,3 +298,151 @@ def gen_straight_tracks(N=10):
         a = math.tan(math.pi / 6 * (a - 0.5))
         tracks[i] = LineTrack(a, b)
     return tracks
+
+
+class Uniform(object):
+
+    """ Uniform distribution from *low* to *high*, for
+    :py:class:`TrackGenerator`. """
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng, n):
+        """ Draw *n* values with the random number generator *rng*.
+
+        :rtype: list(float)"""
+        low, width, draw = self.low, self.high - self.low, rng.random
+        return [low + width * draw() for _ in xrange(n)]
+
+
+class Normal(object):
+
+    """ Normal distribution with the given *mean* and standard deviation
+    *sigma*, for :py:class:`TrackGenerator`. """
+
+    def __init__(self, mean, sigma):
+        self.mean = mean
+        self.sigma = sigma
+
+    def sample(self, rng, n):
+        """ Draw *n* values with the random number generator *rng*.
+
+        :rtype: list(float)"""
+        mean, sigma, draw = self.mean, self.sigma, rng.gauss
+        return [draw(mean, sigma) for _ in xrange(n)]
+
+
+class Constant(object):
+
+    """ Distribution always returning *value*, for :py:class:`TrackGenerator`.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def sample(self, rng, n):
+        """ Return *n* copies of the value.
+
+        :rtype: list(float)"""
+        return [self.value] * n
+
+
+class TrackGenerator(object):
+
+    """Configurable generator of random tracks, producing them in batches of
+    at most *batch_size* tracks as :py:class:`TrackCollection` objects. The
+    batches are created lazily, so arbitrarily large samples can be streamed
+    through a detector::
+
+        >>> generator = TrackGenerator(angle=Normal(0, 5), seed=42)
+        >>> for batch in generator.batches(10 ** 8):
+        ...     hits = detector.simulate(batch)
+
+    The parameters of a batch are drawn column by column: first all angles,
+    then all intercepts (and field strengths), so the tracks drawn with a
+    given seed also depend on the batch size. A distribution is any object
+    with a ``sample(rng, n)`` method returning *n* values, like
+    :py:class:`Uniform`, :py:class:`Normal` and :py:class:`Constant`.
+
+    :param angle: distribution of the track angles in degrees, the slope is
+     the tangent of the angle. The default (-15 to 15 degrees) is the range
+     of :py:func:`gen_straight_tracks`.
+    :param intercept: distribution of the **y** intercepts at 0
+    :param field: distribution of the magnetic field strengths, ``None`` for
+     straight tracks. Fields of 0 (or of magnitude below *min_field*) are
+     drawn again, as a magnetic track needs a field.
+    :param seed: seed of a new ``random.Random`` generator
+    :param rng: random number generator to use instead of a seeded one
+    :param int batch_size: largest number of tracks in a batch
+    :param float min_field: smallest accepted magnitude of a field
+    """
+
+    # rounds of drawing fields again before giving up
+    MAX_REDRAWS = 100
+
+    def __init__(self, angle=None, intercept=None, field=None, seed=None,
+                 rng=None, batch_size=10000, min_field=1e-12):
+        self.angle = Uniform(-15.0, 15.0) if angle is None else angle
+        self.intercept = (Uniform(-0.1, 0.1) if intercept is None
+                          else intercept)
+        self.field = field
+        if rng is None:
+            rng = random.Random(seed)
+        self.rng = rng
+        self.batch_size = batch_size
+        self.min_field = min_field
+
+    def _fields(self, n):
+        """ Draw *n* field strengths, drawing too weak ones again.
+
+        :raises ValueError: if the distribution keeps returning weak fields
+        """
+        B = self.field.sample(self.rng, n)
+        for _ in xrange(self.MAX_REDRAWS):
+            weak = [i for i, field in enumerate(B)
+                    if abs(field) < self.min_field]
+            if not weak:
+                return B
+            for i, field in zip(weak, self.field.sample(self.rng, len(weak))):
+                B[i] = field
+        raise ValueError("The field distribution keeps returning fields "
+                         "weaker than {}".format(self.min_field))
+
+    def batch(self, n):
+        """ Return a batch of *n* tracks.
+
+        :rtype: TrackCollection
+        :raises ValueError: if the field distribution keeps returning fields
+         of 0"""
+        a = [math.tan(math.radians(angle))
+             for angle in self.angle.sample(self.rng, n)]
+        b = self.intercept.sample(self.rng, n)
+        if self.field is None:
+            return TrackCollection(a, b)
+        B = self._fields(n)
+        return TrackCollection(a, b, B, [TrackCollection.MAGNETIC] * n)
+
+    def batches(self, n=None):
+        """Yield *n* tracks in batches of :py:attr:`batch_size` (the last one
+        may be smaller). Without *n* the batches never end.
+
+        :return: generator of :py:class:`TrackCollection`
+        """
+        remaining = n
+        while remaining is None or remaining > 0:
+            size = self.batch_size
+            if remaining is not None:
+                size = min(size, remaining)
+                remaining -= size
+            yield self.batch(size)
+
+    def generate(self, n):
+        """ Return *n* tracks in a single collection.
+
+        :rtype: TrackCollection"""
+        tracks = TrackCollection()
+        for batch in self.batches(n):
+            tracks.extend(batch)
+        return tracks